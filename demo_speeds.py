@@ -0,0 +1,43 @@
+from machine import SPI, Pin
+from uc8151 import UC8151
+import framebuf, random, time
+
+spi = SPI(0, baudrate=12000000, phase=0, polarity=0, sck=Pin(18), mosi=Pin(19), miso=Pin(16))
+eink = UC8151(spi,cs=17,dc=20,rst=21,busy=26,speed=2,no_flickering=False)
+
+gs8buf = bytearray(128*296)
+gsfb = framebuf.FrameBuffer(gs8buf,128,296,framebuf.GS8)
+square_id = 0
+for x in range(0,128,128//4):
+    for y in range(0,296,296//8):
+        color = int((255/31)*square_id)
+        gsfb.fill_rect(x,y,128//4,296//8,color)
+        square_id += 1
+
+eink.update_greyscale(gs8buf,32)
+time.sleep(2)
+
+for speed in [2,3,4.3,5]:
+    for noflick in [False,True]:
+        # Reconfig
+        eink.speed = speed
+        eink.no_flickering = noflick
+        eink.set_waveform_lut()
+
+        random.seed(123)
+        for _ in range(4):
+            eink.fb.text(f"Speed:{speed}",2,0)
+            eink.fb.text(f"No_Flick:{noflick}",2,10)
+            x = random.randrange(100)
+            y = 80+random.randrange(100)
+            eink.fb.text("TEST",x,y,1)
+            eink.fb.ellipse(x,y,50,30,1)
+            eink.fb.fill_rect(x,y+50,50,50,1)
+            start = time.ticks_ms()
+            eink.update(blocking=True)
+            update_time = time.ticks_ms() - start
+            print("Update time:",update_time)
+            eink.fb.fill(0)
+            eink.fb.text(f"delay MS:{update_time}",10,25)
+            time.sleep(1)
+
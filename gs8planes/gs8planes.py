@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# Convert images into files of precomputed greyscale passes, that the
+# driver can display with load_greyscale_planes() without any CPU work
+# on the device (see uc8151_greyscale.py for the file format).
+#
+# Copyright(C) 2024 Salvatore Sanfilippo <antirez@gmail.com>
+# MIT license.
+
+import argparse, os, struct, sys
+import numpy as np
+
+GREYSCALES = [32,16,8,4] # Same as update_greyscale().
+IMAGE_EXTENSIONS = (".gs8",".png",".jpg",".jpeg",".bmp",".gif",".tif",".tiff",".webp")
+
+# Load an image as a width*height array of 8 bit grey values, 0 black
+# and 255 white. Both gs8 files and any image format supported by Pillow
+# are accepted.
+def load_image(filename,width,height):
+    if filename.endswith(".gs8"):
+        data = open(filename,"rb").read()
+        w,h = struct.unpack(">HH",data[:4])
+        img = np.frombuffer(data,dtype=np.uint8,count=w*h,offset=4).reshape(h,w)
+        if (w,h) == (width,height): return img
+        from PIL import Image
+        img = Image.fromarray(img,"L")
+    else:
+        from PIL import Image
+        img = Image.open(filename).convert("L")
+    if img.size != (width,height):
+        img = img.resize((width,height),Image.LANCZOS)
+    return np.asarray(img,dtype=np.uint8)
+
+# Apply the grey response curve: first the optional piecewise linear
+# curve, given as a list of (input,output) points in the 0-255 range,
+# then the gamma correction. The result is rounded back to 8 bits.
+def apply_curve(img,gamma,curve):
+    v = img.astype(np.float64)
+    if curve:
+        xs,ys = zip(*sorted(curve))
+        v = np.interp(v,xs,ys)
+    if gamma != 1:
+        v = 255*(v/255)**gamma
+    return np.clip(np.rint(v),0,255).astype(np.uint8)
+
+# Compute the passes exactly like update_greyscale() does on the device:
+# each pass handles three grey levels, using the WW, BB and WB conditions
+# between the old image (fb2) and the new image (fb1), and leaves the
+# other pixels untouched with the BW condition. Passes without pixels
+# to set are omitted. Returns a list of (level,fb1,fb2): the LUT durations
+# of each pass are computed by the driver from the level, see
+# pass_durations() in uc8151_greyscale.py.
+def compute_passes(img,greyscale):
+    shift = 3+GREYSCALES.index(greyscale)
+    converted = (255-img.astype(np.int32).ravel()) >> shift
+    passes = []
+    for g in range(0,greyscale,3):
+        level = g+1
+        ww = converted == level
+        bb = converted == level+1
+        wb = converted == level+2
+        if not (ww.any() or bb.any() or wb.any()): continue
+        bw = ~(ww | bb | wb)
+        fb1 = np.packbits(bb | wb)
+        fb2 = np.packbits(bb | bw)
+        passes.append((g,fb1.tobytes(),fb2.tobytes()))
+    return passes
+
+def encode(passes,width,height,greyscale,frames_to_black):
+    out = bytearray(struct.pack(">HHHHH",width,height,len(passes),greyscale,frames_to_black))
+    for g,fb1,fb2 in passes:
+        out += bytes([g])+fb1+fb2
+    return out
+
+# Return the longest LUT duration, in frames, the driver will use for the
+# given settings at the highest PLL frequency (200 HZ). This must fit in
+# the LUT bytes. Same computation of pass_durations() in the driver.
+def max_duration(greyscale,frames_to_black):
+    f = frames_to_black*200//100
+    g = (greyscale-1)//3*3 # Last pass.
+    return int(f/(greyscale-1)*(g+3))
+
+# Parse a curve given as "in:out,in:out,...".
+def parse_curve(s):
+    points = []
+    for p in s.split(","):
+        i,o = p.split(":")
+        points.append((int(i),int(o)))
+    return points
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert images into precomputed greyscale passes for the UC8151 driver.")
+    parser.add_argument("images",nargs="+",help="images to convert (or directories)")
+    parser.add_argument("-o","--output",default=".",help="output directory")
+    parser.add_argument("--width",type=int,default=128)
+    parser.add_argument("--height",type=int,default=296)
+    parser.add_argument("--greyscale",type=int,default=16,choices=GREYSCALES,help="number of grey levels")
+    parser.add_argument("--frames-to-black",type=int,default=32,help="frames (at 100 HZ) to go from white to black")
+    parser.add_argument("--gamma",type=float,default=1.0,help="gamma correction applied before quantization")
+    parser.add_argument("--curve",type=parse_curve,default=None,help="piecewise linear grey response curve, as in:out points, for example 0:0,128:100,255:255")
+    args = parser.parse_args()
+
+    if args.width % 8:
+        sys.exit("Width must be a multiple of 8")
+    if max_duration(args.greyscale,args.frames_to_black) > 255:
+        sys.exit("Too many frames to black: LUT durations would not fit in 8 bits at 200 HZ")
+
+    files = []
+    for f in args.images:
+        if os.path.isdir(f):
+            files += sorted(os.path.join(f,n) for n in os.listdir(f)
+                            if n.lower().endswith(IMAGE_EXTENSIONS))
+        else:
+            files.append(f)
+    os.makedirs(args.output,exist_ok=True)
+
+    for f in files:
+        img = load_image(f,args.width,args.height)
+        img = apply_curve(img,args.gamma,args.curve)
+        passes = compute_passes(img,args.greyscale)
+        data = encode(passes,args.width,args.height,args.greyscale,args.frames_to_black)
+        name = os.path.splitext(os.path.basename(f))[0]+".gsp"
+        with open(os.path.join(args.output,name),"wb") as out: out.write(data)
+        print(f"{f} -> {name}: {len(passes)} passes, {len(data)} bytes")
+
+if __name__ == "__main__":
+    main()
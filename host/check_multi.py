@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+# Check, with simulated displays, that MultiUC8151.update() overlaps the
+# refresh of multiple displays: updating three displays should take about
+# the time of a single refresh, not the sum of the three.
+#
+# Copyright(C) 2024 Salvatore Sanfilippo <antirez@gmail.com>
+# MIT license.
+
+import os, sys, time
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,os.path.join(os.path.dirname(os.path.abspath(__file__)),".."))
+import uc8151_host
+from uc8151 import UC8151, MultiUC8151
+
+REFRESH_TIME = 0.3
+
+spi = uc8151_host.SPI()
+displays = []
+dc = None
+for i in range(3):
+    cs,dc,busy = uc8151_host.display_pins(spi,dc,REFRESH_TIME)
+    displays.append(UC8151(spi,cs=cs,dc=dc,rst=uc8151_host.Pin(),busy=busy,speed=4))
+multi = MultiUC8151(displays)
+
+start = time.monotonic()
+for d in displays: d.update()
+sequential = time.monotonic()-start
+
+start = time.monotonic()
+multi.update()
+overlapped = time.monotonic()-start
+
+print(f"one by one: {sequential:.2f} s, MultiUC8151: {overlapped:.2f} s")
+if overlapped > REFRESH_TIME*1.5:
+    sys.exit("Refreshes are not overlapped")
@@ -0,0 +1,143 @@
+# Stand-ins to run the UC8151 / IL0373 e-paper driver on a host computer
+# with CPython, without the hardware: import this module before uc8151.
+#
+# It provides the MicroPython specific modules and builtins the driver
+# uses (machine, framebuf, micropython.viper, const, ptr8, time.sleep_ms
+# and alike), and stand-in SPI and pin objects that simulate the display
+# BUSY line, so that applications (and the driver itself) can be tested.
+# Viper functions just run as normal Python code, so they are slow.
+#
+# Copyright(C) 2024 Salvatore Sanfilippo <antirez@gmail.com>
+# MIT license.
+
+import builtins, sys, time, types
+
+# MicroPython builtins and the micropython module. Viper pointer types
+# are only used as annotations and casts of bytearrays, that in Python
+# can be indexed the same way.
+builtins.const = lambda x: x
+for name in ("ptr8","ptr16","ptr32"): setattr(builtins,name,lambda buf: buf)
+builtins.uint = int
+micropython = types.ModuleType("micropython")
+micropython.const = builtins.const
+micropython.viper = lambda f: f
+micropython.native = lambda f: f
+builtins.micropython = micropython # Decorators work without import.
+sys.modules["micropython"] = micropython
+
+# MicroPython time functions.
+if not hasattr(time,"sleep_ms"):
+    time.sleep_ms = lambda ms: time.sleep(ms/1000)
+    time.ticks_ms = lambda: int(time.monotonic()*1000)
+    time.ticks_us = lambda: int(time.monotonic()*1000000)
+    time.ticks_add = lambda a,b: a+b
+    time.ticks_diff = lambda a,b: a-b
+
+# A pin that just remembers its value.
+class Pin:
+    OUT = 1
+    IN = 0
+    def __init__(self,pin=None,mode=None):
+        self.pin = pin
+        self.v = 1
+    def on(self): self.v = 1
+    def off(self): self.v = 0
+    def value(self,v=None):
+        if v == None: return self.v
+        self.v = v
+
+machine = types.ModuleType("machine")
+machine.Pin = Pin
+sys.modules["machine"] = machine
+
+# Pure Python framebuf, implementing the formats and the drawing
+# primitives used by the driver. text() draws a box for each character,
+# since the MicroPython font is not available.
+framebuf = types.ModuleType("framebuf")
+framebuf.MONO_HLSB = 3
+framebuf.GS8 = 6
+
+class FrameBuffer:
+    def __init__(self,buf,width,height,format):
+        self.buf = buf
+        self.width = width
+        self.height = height
+        self.format = format
+        self.stride = (width+7)//8 if format == framebuf.MONO_HLSB else width
+
+    def pixel(self,x,y,c=None):
+        if x < 0 or y < 0 or x >= self.width or y >= self.height: return
+        if self.format == framebuf.GS8:
+            if c == None: return self.buf[y*self.width+x]
+            self.buf[y*self.width+x] = c
+            return
+        i = y*self.stride+(x >> 3)
+        bit = 0x80 >> (x & 7)
+        if c == None: return 1 if self.buf[i] & bit else 0
+        if c: self.buf[i] |= bit
+        else: self.buf[i] &= 0xff ^ bit
+
+    def fill_rect(self,x,y,w,h,c):
+        for yy in range(max(y,0),min(y+h,self.height)):
+            for xx in range(max(x,0),min(x+w,self.width)):
+                self.pixel(xx,yy,c)
+
+    def fill(self,c):
+        if self.format == framebuf.MONO_HLSB:
+            v = 0xff if c else 0
+        else:
+            v = c
+        for i in range(len(self.buf)): self.buf[i] = v
+
+    def hline(self,x,y,w,c): self.fill_rect(x,y,w,1,c)
+    def vline(self,x,y,h,c): self.fill_rect(x,y,1,h,c)
+
+    def rect(self,x,y,w,h,c,f=False):
+        if f: return self.fill_rect(x,y,w,h,c)
+        self.hline(x,y,w,c)
+        self.hline(x,y+h-1,w,c)
+        self.vline(x,y,h,c)
+        self.vline(x+w-1,y,h,c)
+
+    def text(self,s,x,y,c=1):
+        for i in range(len(s)):
+            if s[i] != " ": self.rect(x+i*8+1,y+1,6,6,c)
+
+framebuf.FrameBuffer = FrameBuffer
+sys.modules["framebuf"] = framebuf
+
+# SPI bus stand-in, logging all the transfers. If displays are attached
+# with attach(), the refresh command (DRF) makes the BUSY line of the
+# selected display low for 'refresh_time' seconds, like a real display.
+class SPI:
+    def __init__(self):
+        self.log = []
+        self.displays = []
+
+    def attach(self,cs,dc,busy):
+        self.displays.append((cs,dc,busy))
+
+    def write(self,data):
+        data = bytes(data)
+        self.log.append(data)
+        for cs,dc,busy in self.displays:
+            if cs.v == 0 and dc.v == 0 and data == b"\x12": busy.start()
+
+# BUSY line of a simulated display.
+class BusyPin(Pin):
+    def __init__(self,refresh_time=0.3):
+        super().__init__()
+        self.refresh_time = refresh_time
+        self.until = 0
+    def start(self): self.until = time.monotonic()+self.refresh_time
+    def value(self,v=None):
+        return 0 if time.monotonic() < self.until else 1
+
+# Create the pins of a simulated display attached to 'spi', sharing
+# the 'dc' pin if given. Returns cs,dc,busy to pass to UC8151().
+def display_pins(spi,dc=None,refresh_time=0.3):
+    cs = Pin()
+    dc = dc or Pin()
+    busy = BusyPin(refresh_time)
+    spi.attach(cs,dc,busy)
+    return cs,dc,busy
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# Convert a sequence of images into an animation file that can be
+# played on the display with the AnimationPlayer class of the driver
+# (see uc8151_anim.py for the file format).
+#
+# Copyright(C) 2024 Salvatore Sanfilippo <antirez@gmail.com>
+# MIT license.
+
+import argparse, os, struct, sys
+from PIL import Image
+
+# Load an image and convert it to a 1 bit framebuffer with the same
+# layout used by the driver (MONO_HLSB, a set bit is a black pixel).
+def load_frame(filename,width,height,threshold,dither):
+    img = Image.open(filename).convert("L")
+    if img.size != (width,height):
+        img = img.resize((width,height),Image.LANCZOS)
+    if dither:
+        img = img.convert("1")
+        pixels = [0 if p else 1 for p in img.getdata()]
+    else:
+        pixels = [1 if p < threshold else 0 for p in img.getdata()]
+    fb = bytearray(width*height//8)
+    for i,p in enumerate(pixels):
+        if p: fb[i>>3] |= 0x80 >> (i&7)
+    return fb
+
+# Return the list of rectangles (x8,y,w8,h) covering the bytes that
+# differ in the XOR of two frames. Consecutive changed rows are grouped
+# in the same rectangle, unless the unchanged rows between them would
+# cost more than starting a new rectangle (6 bytes of header).
+def dirty_rects(delta,stride,height):
+    rows = []
+    for y in range(height):
+        row = delta[y*stride:(y+1)*stride]
+        changed = [i for i in range(stride) if row[i]]
+        rows.append((changed[0],changed[-1]+1) if changed else None)
+
+    rects = []
+    current = None # [x1,y1,x2,y2]
+    gap = 0
+    for y,r in enumerate(rows):
+        if r == None:
+            gap += 1
+            continue
+        if current:
+            x1 = min(current[0],r[0])
+            x2 = max(current[2],r[1])
+            if gap*(x2-x1) <= 6:
+                current = [x1,current[1],x2,y+1]
+                gap = 0
+                continue
+            rects.append(current)
+        current = [r[0],y,r[1],y+1]
+        gap = 0
+    if current: rects.append(current)
+    return [(x1,y1,x2-x1,y2-y1) for x1,y1,x2,y2 in rects]
+
+def encode(frames,width,height,frame_ms):
+    stride = width//8
+    out = bytearray(struct.pack(">HHHH",width,height,len(frames),frame_ms))
+    prev = bytearray(width*height//8)
+    for fb in frames:
+        delta = bytes(a^b for a,b in zip(prev,fb))
+        rects = dirty_rects(delta,stride,height)
+        out += struct.pack(">H",len(rects))
+        for x8,y,w8,h in rects:
+            out += struct.pack(">BHBH",x8,y,w8,h)
+            for row in range(y,y+h):
+                off = row*stride+x8
+                out += delta[off:off+w8]
+        prev = fb
+    return out
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert images into an animation for the UC8151 driver.")
+    parser.add_argument("output",help="output animation file")
+    parser.add_argument("frames",nargs="+",help="frame images, in order (or a directory)")
+    parser.add_argument("--width",type=int,default=128)
+    parser.add_argument("--height",type=int,default=296)
+    parser.add_argument("--frame-ms",type=int,default=0,help="frame duration in milliseconds (0 = as fast as the display allows)")
+    parser.add_argument("--threshold",type=int,default=128,help="pixels darker than this become black")
+    parser.add_argument("--dither",action="store_true",help="use Floyd-Steinberg dithering instead of a threshold")
+    args = parser.parse_args()
+
+    files = args.frames
+    if len(files) == 1 and os.path.isdir(files[0]):
+        d = files[0]
+        files = sorted(os.path.join(d,f) for f in os.listdir(d))
+    if args.width % 8:
+        sys.exit("Width must be a multiple of 8")
+
+    frames = [load_frame(f,args.width,args.height,args.threshold,args.dither) for f in files]
+    data = encode(frames,args.width,args.height,args.frame_ms)
+    with open(args.output,"wb") as f: f.write(data)
+    print(f"{len(frames)} frames, {len(data)} bytes")
+
+if __name__ == "__main__":
+    main()
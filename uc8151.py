@@ -142,13 +142,24 @@ HZ_67      = const(0b00111011)
 HZ_100     = const(0b00111010)
 HZ_200     = const(0b00111001)
 
+# PLL register value for each supported frequency.
+PLL_FREQUENCIES = {29:HZ_29, 33:HZ_33, 40:HZ_40, 50:HZ_50, 67:HZ_67, 100:HZ_100, 200:HZ_200}
+
+# Pins can be given as numbers or as already configured Pin objects (or
+# any object with the same interface, for instance to test the driver
+# without the hardware).
+def make_pin(pin,mode):
+    if pin == None: return None
+    if isinstance(pin,int): return Pin(pin,mode)
+    return pin
+
 class UC8151:
-    def __init__(self,spi,*,cs,dc,rst,busy,width=128,height=296,speed=0,mirror_x=False,mirror_y=False,inverted=False,no_flickering=False,debug=False,full_update_period=50,dangerous_reaffirm_black=False):
+    def __init__(self,spi,*,cs,dc,rst,busy,width=128,height=296,speed=0,mirror_x=False,mirror_y=False,inverted=False,no_flickering=False,debug=False,full_update_period=50,dangerous_reaffirm_black=False,warm_start=False,frequency=100):
         self.spi = spi
-        self.cs = Pin(cs,Pin.OUT) if cs != None else None
-        self.dc = Pin(dc,Pin.OUT) if dc != None else None
-        self.rst = Pin(rst,Pin.OUT) if rst != None else None
-        self.busy = Pin(busy,Pin.IN) if busy != None else None
+        self.cs = make_pin(cs,Pin.OUT)
+        self.dc = make_pin(dc,Pin.OUT)
+        self.rst = make_pin(rst,Pin.OUT)
+        self.busy = make_pin(busy,Pin.IN)
         self.width = width
         self.height = height
         self.speed = speed
@@ -158,13 +169,39 @@ class UC8151:
         self.mirror_x = mirror_x
         self.mirror_y = mirror_y
         self.debug = debug
-        self.initialize_display()
+        if frequency not in PLL_FREQUENCIES:
+            raise ValueError("Unsupported PLL frequency")
+        self.frequency = frequency
+
+        # Set by MultiUC8151 when the displays share the reset line.
+        self.reset_group = None
+
+        # With warm_start the display was already initialized by this
+        # driver, with the same settings, and it is still powered and
+        # not in deep sleep (for instance the microcontroller was reset
+        # or woke up from its own sleep): the registers are still valid,
+        # so nothing is sent to the display. If the display was put in
+        # deep sleep with sleep(), call resume() after creating the
+        # object, see below.
+        self.sleeping = False
+        self.lut_duration_ms = None # Refresh time, set with the LUTs.
+        if warm_start:
+            self.set_waveform_lut(load=False)
+        else:
+            self.initialize_display()
         self.raw_fb = bytearray(width*height//8)
         self.fb = framebuf.FrameBuffer(self.raw_fb,width,height,framebuf.MONO_HLSB)
+        self.font = None # Built-in font for text(), created on first use.
+        self.last_image = None # Last buffer sent as new image.
+        self.overlay_fb = None # Last overlay shown by update_overlay().
 
         # Updates done with the current speed settings.
         self.update_count = 0
 
+        # Set when a non blocking update forced a flickered refresh: the
+        # configured LUTs are loaded again once the refresh is complete.
+        self.lut_restore_pending = False
+
         # From time to time, if partial updates or no-flickering updates
         # are used, we perform a full update regardless, to remove ghosting,
         # make the background color more even and so forth.
@@ -173,14 +210,20 @@ class UC8151:
     # Return true if the display is busy performing an update, or also
     # if for any other reason it is not able to accept commands right now.
     def is_busy(self):
+        if self.sleeping or self.busy == None: return False
         return self.busy.value() == False # Low on busy condition.
 
     def wait_ready(self):
         if self.busy == None: return
         while self.is_busy(): pass
 
-    # Perform hardware reset.
+    # Perform hardware reset. If the reset line is not available (for
+    # instance because it is shared with other displays and it was
+    # given only to the first one) we just wait for the chip to be ready.
     def reset(self):
+        if self.rst == None:
+            self.wait_ready()
+            return
         self.rst.off()
         time.sleep_ms(10)
         self.rst.on()
@@ -190,6 +233,7 @@ class UC8151:
     # Send just a command, just data, or a command + data, depending
     # on cmd or data being both bytes() / bytearrays() or None.
     def write(self,cmd=None,data=None):
+        if self.sleeping: self.resume()
         self.wait_ready()
         self.cs.off()
         self.dc.off() # Command mode
@@ -201,12 +245,24 @@ class UC8151:
             self.spi.write(data)
         self.cs.on()
 
+    # Send just data, without a command. Used to transfer data in
+    # multiple chunks after a command sent with write().
+    def write_data(self,data):
+        self.cs.off()
+        self.dc.on() # Data mode
+        self.spi.write(data)
+        self.cs.on()
+
     # This function sets the PSR register, a key register to
     # set up the panel configuration. We call this function each
     # time a new speed / LUTs are configured, because when we
     # revert to the default LUTs (speed 0) the PSR register
     # must be set to look into the internal tables.
-    def set_panel_configuration(self):
+    #
+    # 'speed' can be given to configure the panel for a speed different
+    # than the current one, like set_waveform_lut() does.
+    def set_panel_configuration(self,speed=None):
+        if speed == None: speed = self.speed
         # Panel configuration: resolution, format and so forth.
         psr_settings = FORMAT_BW | BOOSTER_ON | RESET_NONE
 
@@ -224,7 +280,7 @@ class UC8151:
         # If we select the default update speed, we will use the
         # lookup tables defined by the device. Otherwise the values for
         # the lookup tables must be read from the registers we set.
-        if self.speed == 0:
+        if speed == 0:
             psr_settings |= LUT_OTP
         else:
             psr_settings |= LUT_REG
@@ -283,7 +339,8 @@ class UC8151:
         # observed that the display is more stable after being completely
         # disconnected if we use a 40 millisecond delay. There is a cost
         # for this of course: more latency in functions executing the POF
-        # command.
+        # command. Note that at 200 HZ the 4 frames only last 20
+        # milliseconds, see set_frequency().
         self.write(CMD_PFS,FRAMES_4)
 
         # Use the internal temperature sensor. Unfortunately there is
@@ -309,74 +366,69 @@ class UC8151:
         # PLL clock frequency. Setting it to 100 HZ means that each
         # "frame" in the counts in the refresh waveforms lookup tables will
         # last 10 milliseconds. Certain drivers set it to 200 HZ for the fast
-        # modes, but in my tests it does not work well at all, so we take
-        # it to a fixed 100 HZ.
-        self.write(CMD_PLL,HZ_100)
+        # modes, but in my tests it does not work well with the same frame
+        # counts, so by default we use 100 HZ. Other frequencies can be
+        # selected with the 'frequency' parameter or set_frequency(): the
+        # computed LUTs are scaled to keep the same timings, but with a
+        # finer granularity, see set_waveform_lut().
+        self.write(CMD_PLL,PLL_FREQUENCIES[self.frequency])
 
         # Power off the display. We will pover on it again on the
         # next update of the image.
         self.write(CMD_POF)
 
-    # This function is only for debugging. We use computed LUTs, however
-    # it is quite handy in order to experiment with different display
-    # capabilities to play with the tables by hand and quickly check the
-    # results. This function should be removed eventually since it uses
-    # a lot of MicroPython memory because of the tables.
+    # Put the display in deep sleep mode, where it uses almost no power
+    # at all, after waiting for any update in progress. The display will
+    # be woken up by resume(), that is called automatically when the next
+    # command is sent to the display: there is no need to call it
+    # explicitly.
+    #
+    # Waking up requires a hardware reset, so the reset line must be
+    # available, directly or via the other displays of a MultiUC8151.
+    def sleep(self):
+        if self.rst == None and self.reset_group == None:
+            raise ValueError("Deep sleep requires the reset line")
+        self.wait_and_switch_off()
+        self.write(CMD_DSLP,0xa5) # 0xa5 is the check code to confirm.
+        self.sleeping = True
+
+    # Wake up the display from deep sleep. This requires a hardware
+    # reset, that brings all the registers back to their default values.
+    # Compared to initialize_display() we save time setting only the
+    # registers where we don't use the default value: PWR, BTST, TSE and
+    # TCON are set by initialize_display() to the chip defaults, so they
+    # are not sent again.
     #
-    # P.S. the currently set LUTs in the tables are just trivial
-    # examples and don't have any special use.
+    # If the reset line is shared with other displays (see MultiUC8151)
+    # the reset affects all of them, so they are all configured again.
+    def resume(self):
+        if self.reset_group != None:
+            self.reset_group.resume()
+            return
+        self.sleeping = False
+        self.reset()
+        self.restore_registers()
+
+    # Set again the registers lost with a hardware reset, see resume().
+    def restore_registers(self):
+        self.set_panel_configuration()
+        self.set_waveform_lut()
+        self.write(CMD_PFS,FRAMES_4)
+        self.write(CMD_CDI,0b11_01_1100 if self.inverted else 0b11_00_1100)
+        self.write(CMD_PLL,PLL_FREQUENCIES[self.frequency])
+
+        # The old image in the display memory is not reliable after
+        # the deep sleep, so in no flickering modes the next update
+        # will be a full one.
+        self.update_count = 0
+
+    # Debugging and LUT experimentation tools are in uc8151_debug.py, and
+    # like the other optional features of the driver (greyscale, text
+    # rendering, ...) they are imported only when used, so that
+    # applications not using them don't waste memory.
     def set_handmade_lut(self):
-        VCOM = bytes([
-          0x00, 0x01, 0x01, 0x02, 0x00, 0x01,
-          0x00, 0x02, 0x02, 0x03, 0x00, 0x02,
-          0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-          0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-          0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-          0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-          0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-          0x00, 0x00
-        ])
-        BW = bytes([
-          0x99, 0x02, 0x02, 0x00, 0x00, 0x01,
-          0xaa, 0x02, 0x02, 0x03, 0x00, 0x02,
-          0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-          0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-          0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-          0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-          0x00, 0x00, 0x00, 0x00, 0x00, 0x00
-        ])
-        WB = bytes([
-          0x66, 0x02, 0x02, 0x00, 0x00, 0x01,
-          0x55, 0x02, 0x02, 0x03, 0x00, 0x02,
-          0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-          0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-          0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-          0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-          0x00, 0x00, 0x00, 0x00, 0x00, 0x00
-        ])
-        WW = bytes([
-          0b01_10_0000, 0x08, 0x08, 0x00, 0x00, 0x01,
-          0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-          0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-          0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-          0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-          0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-          0x00, 0x00, 0x00, 0x00, 0x00, 0x00
-        ])
-        BB = bytes([
-          0b10_01_0000, 0x08, 0x08, 0x00, 0x00, 0x01,
-          0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-          0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-          0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-          0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-          0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
-          0x00, 0x00, 0x00, 0x00, 0x00, 0x00
-        ])
-        self.write(CMD_LUT_VCOM,VCOM)
-        self.write(CMD_LUT_BW,BW)
-        self.write(CMD_LUT_WB,WB)
-        self.write(CMD_LUT_BB,BB)
-        self.write(CMD_LUT_WW,WW)
+        from uc8151_debug import set_handmade_lut
+        set_handmade_lut(self)
 
     # This function (after all this big comment) sets the lookup tables
     # used during the display refresh. Before reading it, it's a good
@@ -446,7 +498,10 @@ class UC8151:
     #
     # However they are set to 0 in all the LUTs I saw, so they are generally
     # not used and we don't use it either.
-    def set_waveform_lut(self,speed=None,no_flickering=None):
+    #
+    # With 'load' set to False the LUTs are just computed, updating
+    # lut_duration_ms, but not sent to the display.
+    def set_waveform_lut(self,speed=None,no_flickering=None,*,load=True):
         if speed == None: speed = self.speed
         if no_flickering == None: no_flickering = self.no_flickering
 
@@ -455,10 +510,10 @@ class UC8151:
             # to the one inside the device. __init__() will take care
             # to tell the chip to use internal LUTs by setting the right
             # PSR field to LUT_OTP.
+            self.lut_duration_ms = None # Unknown, depends on the OTP LUTs.
             return
 
-        if speed > 6:
-            raise ValueError("Speed must be set between 0 and 6")
+        self.check_speed(speed,self.frequency)
 
         # In this driver we try to do things a bit differently and compute
         # LUTs on the fly depending on the 'speed' requested by the user.
@@ -485,12 +540,17 @@ class UC8151:
         BB = bytearray(42)
 
         # Those periods are powers of two so that each successive 'speed'
-        # value cuts them in half cleanly.
-        period = 64           # Num. of frames for single direction change.
-        hperiod = period//2   # Num. of frames for back-and-forth change.
+        # value cuts them in half cleanly. They are in frames at 100 HZ,
+        # and are scaled for other frequencies: at 200 HZ the same speed
+        # uses twice the frames, each lasting half the time, so speeds
+        # up to 8 are possible, and fractional speeds are more precise.
+        period = 64*self.frequency/100 # Frames for single direction change.
+        hperiod = period/2 # Frames for back-and-forth change.
         
-        # Actual period is scaled by the speed factor
-        period = int(max(period / (2**(speed-1)), 1))
+        # Actual period is scaled by the speed factor. The unrounded
+        # value is kept for the fast LUTs, see below.
+        fperiod = period / (2**(speed-1))
+        period = int(max(fperiod, 1))
         hperiod = int(max(hperiod / (2**(speed-1)), 1))
 
         # Set the waveform in the LUTs.
@@ -533,12 +593,24 @@ class UC8151:
 
             # Phase 1 for BW/WB. Just go to target color.
             # Phase 1 for WW/BB. Invert, go back.
-            p = period
-            self.set_lut_row(VCOM,0,pat=0,dur=[p,p,p,p],rep=1)
-            self.set_lut_row(BW,0,pat=0b10_00_00_00,dur=[p*4,0,0,0],rep=1)
-            self.set_lut_row(WB,0,pat=0b01_00_00_00,dur=[p*4,0,0,0],rep=1)
-            self.set_lut_row(WW,0,pat=0b01_10_00_00,dur=[p*2,p*2,0,0],rep=1)
-            self.set_lut_row(BB,0,pat=0b10_01_00_00,dur=[p*2,p*2,0,0],rep=1)
+            #
+            # The row lasts four periods. The total is computed from the
+            # unrounded period, so that fractional speeds have their own
+            # duration even when the period is just a few frames, and it
+            # is rounded to the nearest even number of frames, since WW/BB
+            # spend half of it in each direction (so the granularity is
+            # two frames: 10 milliseconds at 200 HZ). Each half is split
+            # in two sub-phases so that durations always fit in the LUT
+            # bytes, even at 200 HZ.
+            half = max(int(2*fperiod+0.5),1)
+            a = (half+1)//2
+            b = half//2
+            dur = [a,b,a,b]
+            self.set_lut_row(VCOM,0,pat=0,dur=dur,rep=1)
+            self.set_lut_row(BW,0,pat=0b10_10_10_10,dur=dur,rep=1)
+            self.set_lut_row(WB,0,pat=0b01_01_01_01,dur=dur,rep=1)
+            self.set_lut_row(WW,0,pat=0b01_01_10_10,dur=dur,rep=1)
+            self.set_lut_row(BB,0,pat=0b10_10_01_01,dur=dur,rep=1)
 
         # If no flickering mode is enabled, we use an empty
         # waveform BB and WW. The screen will be fully refreshed every
@@ -561,7 +633,8 @@ class UC8151:
             # towards greyish color. Potentially this could polarize the
             # display.
             if self.dangerous_reaffirm_black:
-                self.set_lut_row(BB,0,pat=0b10_01_10_01,dur=[0,2,0,0],rep=1)
+                reaffirm = max(2*self.frequency//100,1) # 20 milliseconds.
+                self.set_lut_row(BB,0,pat=0b10_01_10_01,dur=[0,reaffirm,0,0],rep=1)
 
         if self.debug:
             print(f"LUTs for speed {speed} no_flickering {no_flickering}:")
@@ -570,6 +643,14 @@ class UC8151:
             self.show_lut(WW,"WW")
             self.show_lut(BB,"BB")
 
+        # Remember how long the refresh takes with these LUTs: the VCOM
+        # table covers all the steps of the waveform.
+        frames = 0
+        for off in range(0,42,6):
+            frames += sum(VCOM[off+1:off+5])*VCOM[off+5]
+        self.lut_duration_ms = frames*1000//self.frequency
+        if not load: return
+
         # Set the LUTs into the display registers.
         self.write(CMD_LUT_VCOM,VCOM)
         self.write(CMD_LUT_BW,BW)
@@ -577,10 +658,19 @@ class UC8151:
         self.write(CMD_LUT_WW,WW)
         self.write(CMD_LUT_BB,BB)
 
+    # Raise an error if 'speed' can't be used at the given PLL frequency.
+    # Speeds over 6 would need frames shorter than 10 milliseconds,
+    # so they are only available at 200 HZ.
+    def check_speed(self,speed,frequency):
+        max_speed = 8 if frequency >= 200 else 6
+        if speed > max_speed:
+            raise ValueError("Speed must be set between 0 and 6 (8 at 200 HZ)")
+
     # Change the speed once the driver is already initialized.
     # Sometimes in an application there are updates we want to do
     # at high quality, other updates we want to do faster.
     def set_speed(self,new_speed,*,no_flickering=None,full_update_period=None):
+        self.check_speed(new_speed,self.frequency)
         if no_flickering != None:
             self.no_flickering = no_flickering
         if full_update_period != None:
@@ -590,6 +680,28 @@ class UC8151:
         self.set_waveform_lut()
         self.update_count = 0
 
+    # Change the PLL frequency, that sets the duration of each frame of
+    # the waveforms: at 100 HZ (the default) a frame is 10 milliseconds,
+    # at 200 HZ 5 milliseconds, and so forth. The computed LUTs are scaled
+    # to keep the same timings, but higher frequencies allow speeds
+    # up to 8, trading quality for latency. This may be handy for updates
+    # of small regions, like a cursor.
+    #
+    # Note that the discharge performed at power-off (see PFS in
+    # initialize_display()) is also counted in frames, and 4 frames is the
+    # maximum: at 200 HZ it lasts 20 milliseconds instead of the 40 that
+    # were observed to leave the display more stable once disconnected.
+    # At 200 HZ, before removing power from the display, it is safer to
+    # switch back to 100 HZ with set_frequency(100) (and a lower speed),
+    # then do a last update.
+    def set_frequency(self,frequency):
+        if frequency not in PLL_FREQUENCIES:
+            raise ValueError("Unsupported PLL frequency")
+        self.check_speed(self.speed,frequency)
+        self.frequency = frequency
+        self.write(CMD_PLL,PLL_FREQUENCIES[frequency])
+        self.set_waveform_lut()
+
     # Set a given row in a waveform lookup table.
     # Lookup tables are 6 rows per 7 cols, like in this
     # example:
@@ -625,22 +737,27 @@ class UC8151:
 
     # Show a well-formatted LUT table. Useful for debugging.
     def show_lut(self,lut,name):
-        print(name,":")
-        for i in range(7):
-            if i > 0 and lut[i*6] == 0: break
-            print(bin(lut[i*6]|256)[3:],end=' ')
-            for j in range(1,6):
-                print(hex(lut[i*6+j]),end=' ')
-            print("")
-        print("---")
+        from uc8151_debug import show_lut
+        show_lut(lut,name)
 
     # Wait for the display to return back able to accept commands
     # (if it is updating the display it remains busy), and switch
     # it off once it is possible.
     def wait_and_switch_off(self):
         self.wait_ready()
+        self.restore_waveform_lut()
         self.write(CMD_POF)
 
+    # Load back the configured LUTs (and the panel configuration, that
+    # selects the OTP LUTs at speed 0) if a non blocking update had to
+    # perform a refresh with different LUTs. This waits for the refresh
+    # to complete.
+    def restore_waveform_lut(self):
+        if self.lut_restore_pending:
+            self.lut_restore_pending = False
+            self.set_panel_configuration()
+            self.set_waveform_lut()
+
     # Update the screen with the current image in the framebuffer.
     # If 'fb' is passed, we use a different framebuffer instead.
     # If blocking is True, the function blocks until the update
@@ -648,12 +765,25 @@ class UC8151:
     # will remain powered on, and can (and should) be turned off later
     # with wait_and_switch_off().
     #
+    # If 'old_fb' is passed, it is transferred as the old image before
+    # 'fb', so that the waveforms applied depend on the transition from
+    # 'old_fb' to 'fb', regardless of what the display memory contained.
+    #
+    # If 'region' is passed, as a (x,y,width,height) tuple, only that
+    # part of the display is transferred and updated (partial update),
+    # see send_image().
+    #
     # The function returns False and does nothing in case the
     # blocking argument is False but there is an update already
     # in progress. Otherwise True is returned and the display is updated.
-    def update(self,blocking=True,fb=None):
+    def update(self,blocking=True,fb=None,old_fb=None,region=None):
         if fb == None: fb = self.raw_fb
+        if region != None:
+            region = self.align_region(region)
+            if region == None: return True # Nothing to update.
+        if self.sleeping: self.resume() # Before checking update_count.
         if blocking == False and self.is_busy(): return False
+        self.restore_waveform_lut()
 
         # At the first refresh with a no-flickering mode, and also
         # every N refreshes, do a full refresh. Unless it's set to 0.
@@ -663,11 +793,17 @@ class UC8151:
 
         if do_full_update: self.set_waveform_lut(min(2,self.speed),False)
 
-        self.send_image(fb)
+        if old_fb != None: self.send_image(old_fb,old=True,region=region)
+        self.send_image(fb,region=region)
         self.write(CMD_DRF) # Start refresh cycle.
 
         # Load back the no-flickering LUTs if we forced a flickered refresh.
-        if do_full_update: self.set_waveform_lut()
+        # Writing the LUTs waits for the refresh to complete, so for non
+        # blocking updates this is deferred to the next update or to
+        # wait_and_switch_off().
+        if do_full_update:
+            self.lut_restore_pending = True
+            if blocking: self.restore_waveform_lut()
 
         if blocking: self.wait_and_switch_off()
         self.update_count += 1
@@ -679,196 +815,92 @@ class UC8151:
     # depending on WW, BB, WB, BW transition. When we refresh, the new
     # framebuffer is automatically copied to the old one, but we can control
     # both framebuffer when we wish to.
-    def send_image(self,fb,old=False):
+    #
+    # The last buffer transferred as new image is remembered in
+    # 'last_image', so that it is possible to tell if the display
+    # is still showing a given buffer.
+    #
+    # If 'region' is given, as returned by align_region(), the chip is
+    # put in partial mode and only the rows of 'fb' inside the region
+    # are transferred: the refresh will only touch the pixels inside it.
+    def send_image(self,fb,old=False,region=None):
         self.write(CMD_PON) # Power on
-        self.write(CMD_PTOU) # Partial mode off
-        if old:
-            self.write(CMD_DTM1,fb) # Transfer to previous image buffer.
+        cmd = CMD_DTM1 if old else CMD_DTM2
+        if region == None:
+            self.write(CMD_PTOU) # Partial mode off
+            self.write(cmd,fb)
         else:
-            self.write(CMD_DTM2,fb) # Transfer to current image buffer.
+            x,y,w,h = region
+            self.write(CMD_PTIN) # Partial mode on
+            # Partial window: horizontal start/end, then vertical
+            # start/end as 9 bit values. The final byte (PT_SCAN) set
+            # to 1 means that gates are scanned also outside the window.
+            self.write(CMD_PTL,[x,x+w-1,y>>8,y&0xff,(y+h-1)>>8,(y+h-1)&0xff,1])
+            self.write(cmd)
+            stride = self.width//8
+            mv = memoryview(fb)
+            for row in range(y,y+h):
+                off = row*stride+x//8
+                self.write_data(mv[off:off+w//8])
+        if not old: self.last_image = fb
         self.write(CMD_DSP) # End of data
 
-    # Helper function to render greyscale images.
-    #
-    # This function has to generate two one-bit images, using the two
-    # framebuffers fb1 and fb2. For three grey levels, we set the
-    # before/after bits in order to trigger the WW/BB/WB conditions,
-    # so that we assign to each of this LUTs the waveform needed to
-    # generate a different level of grey. We use BW for pixels that
-    # should not be toched (either set in past iterations or yet to be
-    # set with a different level of grey than level,level+1,level+2).
-    # 
-    # Using this trick, we can set the pixels of three different levels
-    # of greys in the same update. The image to render should be in
-    # 'grey', where each byte maps to a pixel: higher values means
-    # a more lighter level of grey.
-    #
-    # The three level of greys that this function will match are
-    # given by 'level': from level to level+2 inclusive.
-    @micropython.viper
-    def set_pixels_for_greyscale(self, grey:ptr8, fb1:ptr8, fb2:ptr8, width:int, height:int, shift:int, level:int) -> int:
-        count = int(width*height)
-        anypixel = int(0)
-        for i in range(count//8):
-            fb1[i] = 0
-            fb2[i] = 0
-
-        for i in range(count):
-            # Pixel that reached level "1" are the only ones at the
-            # current grey level we want to set.
-            byte = i >> 3
-            bit = 1 << (7-(i&7))
-
-            # Given that a greater value of the pixel means lighter
-            # pixels, but for the display more frames to turn this pixel
-            # towards black is the reverse, we invert the pixel value.
-            # We also need to scale it from 0-255 to 0-(greys-1).
-            converted = (255-grey[i]) >> shift # Invert and rescale.
-            if converted == level:        # WW condition
-                anypixel = 1
-                pass
-            elif converted == level+1:    # BB condition
-                anypixel = 1
-                fb1[byte] |= bit
-                fb2[byte] |= bit
-            elif converted == level+2:    # WB condition
-                anypixel = 1
-                fb1[byte] |= bit
-            else:                   # BW condition, pixels not touched.
-                fb2[byte] |= bit
-        return anypixel
-
-    # Load and render the greyscale image specified. The
-    # image format must be: 4 bytes WWHH width,height
-    # unsigned 16 bit, big endian. Followed by width*height
-    # bytes. Each byte is a pixel with color 0 (black) to
-    # 255 (white).
-    def load_greyscale_image(self,filename,greyscale=16):
-        # Read image data.
-        f = open(filename,"rb")
-        f.read(4)
-        imgdata = bytearray(self.width*self.height)
-        f.readinto(imgdata)
-        print("Image max luminance:",max(imgdata))
-        self.update_greyscale(imgdata,greyscale)
-
-    # Update the display in greyscale "faked mode" using the image
-    # into the framebuffer "buffer". The buffer should be width*height
-    # pixels (depending on the display size) bytes. Each byte has
-    # a value in the range 0-255, from black to white.
-    def update_greyscale(self,buffer,greyscale):
-        greyscales = [32,16,8,4] # Must be power of 2.
-        frames_to_black = 32 # Frames needed to go from white to black, using
-                             # a too large number may damage the display, but
-                             # using a bit larger number may improve contrast.
-
-        if greyscale not in greyscales:
-            raise ValueError("Unsupproted greyscale")
-
-        # Amount of right shifting to convert 0-255 grey value to
-        # 0-(greyscale-1) value.
-        shift = 3+greyscales.index(greyscale)
-
-        # Prepare the display: we want it to be white, and we want the
-        # registers LUTs to be selected (all speeds but speed 0).
-        orig_speed = self.speed
-        orig_no_flickering = self.no_flickering
-
-        self.set_speed(2,no_flickering=True)
-        self.fb.fill(0)
-        self.update(blocking=True) # All screen white
-
-        # Nothing to do for white pixels or already black pixels.
-        # Set an empty LUT.
-        LUT = bytearray(42)
-        VCOM = bytearray(44)
-
-        # Now for each level of grey in the image, create a bitmap composed
-        # only of pixels of that level of grey, and create an ad-hoc LUT
-        # that polarizes pixels towards black for an amount of time (frames)
-        # proportional to the grey level.
-        fb2 = bytearray(self.width*self.height//8)
-        for g in range(0,greyscale,3):
-            # Resort to a faster method in Viper to set the pixels for the
-            # current greyscale level.
-            anypixel = self.set_pixels_for_greyscale(buffer,self.raw_fb,fb2,self.width,self.height,shift,g+1)
-            if anypixel:
-                # Transfer the "old" image, so that for difference
-                # with the new we transfer via .update() we create
-                # the four set of conditions (WW, BB, WB, BW) based
-                # on the difference between the bits in the two
-                # images.
-                self.send_image(fb2,old=True)
-
-                # We set the framebuffer with just the pixels of the level
-                # of grey we are handling in this cycle, so now we apply
-                # the voltage for a time proportional to this level (see
-                # the setting of LUT[1], that is the number of frames).
-                LUT[0] = 0x55 # Go black
-                LUT[5] = 1 # Repeat 1 for all
-                LUT[1] = int(frames_to_black/(greyscale-1)*(g+1))
-                self.write(CMD_LUT_WW,LUT)
-                LUT[1] = int(frames_to_black/(greyscale-1)*(g+2))
-                self.write(CMD_LUT_BB,LUT)
-                LUT[1] = int(frames_to_black/(greyscale-1)*(g+3))
-                self.write(CMD_LUT_WB,LUT)
-                LUT[1] = 0 # These pixels will be unaffected, none of them
-                           # is of the three colors handled in this cycle.
-                LUT[5] = 0
-                self.write(CMD_LUT_BW,LUT)
-
-                # Minimal VCOM LUT to avoid any unneeded wait.
-                VCOM[0] = 0 # Already zero, just to make it obvious.
-                VCOM[1] = int(frames_to_black/greyscale*(g+3))
-                VCOM[5] = 1
-                self.write(CMD_LUT_VCOM,VCOM)
-
-                # Finally update.
-                self.update(blocking=True)
-
-        # Restore a normal LUT based on configured speed.
-        self.set_speed(orig_speed,no_flickering=orig_no_flickering)
-        self.wait_and_switch_off()
-
-if  __name__ == "__main__":
-    from machine import SPI
-    import random
-
-    spi = SPI(0, baudrate=12000000, phase=0, polarity=0, sck=Pin(18), mosi=Pin(19), miso=Pin(16))
-    eink = UC8151(spi,cs=17,dc=20,rst=21,busy=26,speed=2,no_flickering=False)
-
-    gs8buf = bytearray(128*296)
-    gsfb = framebuf.FrameBuffer(gs8buf,128,296,framebuf.GS8)
-    square_id = 0
-    for x in range(0,128,128//4):
-        for y in range(0,296,296//8):
-            color = int((255/31)*square_id)
-            gsfb.fill_rect(x,y,128//4,296//8,color)
-            square_id += 1
-
-    eink.update_greyscale(gs8buf,32)
-    time.sleep(2)
-
-    for speed in [2,3,4.3,5]:
-        for noflick in [False,True]:
-            # Reconfig
-            eink.speed = speed
-            eink.no_flickering = noflick
-            eink.set_waveform_lut()
-
-            random.seed(123)
-            for _ in range(4):
-                eink.fb.text(f"Speed:{speed}",2,0)
-                eink.fb.text(f"No_Flick:{noflick}",2,10)
-                x = random.randrange(100)
-                y = 80+random.randrange(100)
-                eink.fb.text("TEST",x,y,1)
-                eink.fb.ellipse(x,y,50,30,1)
-                eink.fb.fill_rect(x,y+50,50,50,1)
-                start = time.ticks_ms()
-                eink.update(blocking=True)
-                update_time = time.ticks_ms() - start
-                print("Update time:",update_time)
-                eink.fb.fill(0)
-                eink.fb.text(f"delay MS:{update_time}",10,25)
-                time.sleep(1)
+    # Clip the (x,y,width,height) region to the display and extend it
+    # horizontally to multiples of 8 pixels, since in the framebuffer
+    # (and in the display memory) each byte holds 8 horizontal pixels.
+    # Returns the new region, or None if the region is empty.
+    def align_region(self,region):
+        x,y,w,h = region
+        x2 = min(x+w,self.width)
+        y2 = min(y+h,self.height)
+        x = max(x,0) & ~7
+        y = max(y,0)
+        x2 = (x2+7) & ~7
+        if x2 <= x or y2 <= y: return None
+        return (x,y,x2-x,y2-y)
+
+    # Draw rotated text, see uc8151_text.py.
+    def text(self,s,x,y,color=1,*,rotation=0,font=None):
+        from uc8151_text import text
+        return text(self,s,x,y,color,rotation=rotation,font=font)
+
+    # Greyscale rendering, see uc8151_greyscale.py.
+    def load_greyscale_image(self,filename,greyscale=16,threaded=False):
+        from uc8151_greyscale import load_greyscale_image
+        load_greyscale_image(self,filename,greyscale,threaded)
+
+    def blit_greyscale_image(self,src,x,y,*,sx=0,sy=0,w=None,h=None,canvas=None,threshold=128):
+        from uc8151_greyscale import blit_greyscale_image
+        blit_greyscale_image(self,src,x,y,sx=sx,sy=sy,w=w,h=h,canvas=canvas,threshold=threshold)
+
+    def update_greyscale(self,buffer,greyscale,threaded=False):
+        from uc8151_greyscale import update_greyscale
+        update_greyscale(self,buffer,greyscale,threaded)
+
+    def load_greyscale_planes(self,filename):
+        from uc8151_greyscale import load_greyscale_planes
+        load_greyscale_planes(self,filename)
+
+    def update_overlay(self,fb=None,*,speed=4,blocking=True,region=None):
+        from uc8151_greyscale import update_overlay
+        return update_overlay(self,fb,speed=speed,blocking=blocking,region=region)
+
+# The classes of the optional modules are imported on first access, so
+# that "from uc8151 import MultiUC8151" and alike keep working.
+def __getattr__(name):
+    if name == "BitmapFont":
+        from uc8151_text import BitmapFont
+        return BitmapFont
+    if name == "MultiUC8151":
+        from uc8151_multi import MultiUC8151
+        return MultiUC8151
+    if name == "ScreenCache":
+        from uc8151_cache import ScreenCache
+        return ScreenCache
+    if name == "AnimationPlayer":
+        from uc8151_anim import AnimationPlayer
+        return AnimationPlayer
+    if name == "Layer" or name == "Compositor":
+        import uc8151_compositor
+        return getattr(uc8151_compositor,name)
+    raise AttributeError(name)
@@ -0,0 +1,129 @@
+# Animations playback for the UC8151 / IL0373 e-paper driver.
+# See uc8151.py: AnimationPlayer can also be imported from there.
+#
+# Copyright(C) 2024 Salvatore Sanfilippo <antirez@gmail.com>
+# MIT license.
+
+import time
+
+# XOR the w8*h bytes of 'data' into the rectangle of the MONO_HLSB
+# framebuffer 'fb' starting at byte column x8 and row y. 'stride' is
+# the number of bytes of each framebuffer row.
+@micropython.viper
+def xor_rect(fb:ptr8, stride:int, data:ptr8, x8:int, y:int, w8:int, h:int):
+    i = 0
+    for row in range(y,y+h):
+        off = row*stride+x8
+        for col in range(w8):
+            fb[off+col] ^= data[i]
+            i += 1
+
+# Play animations stored as a sequence of deltas, generated from the
+# frames images by the mkanim tool (see the mkanim directory). The file
+# format is the following:
+#
+# +-------+--------+--------+----------+----------//
+# | width | height | frames | frame_ms | Frames...
+# +-------+--------+--------+----------+----------//
+#
+# All the header fields are big endian unsigned 16 bit integers.
+# 'frame_ms' is the desired frame duration in milliseconds. Each frame
+# is a list of rectangles that changed compared to the previous frame
+# (the first frame is compared with an all white image):
+#
+# +-------+--------+-------//
+# | rects | Rect 1 | Rect 2 ...
+# +-------+--------+-------//
+#
+# 'rects' is an unsigned 16 bit integer. Each rectangle is:
+#
+# +----+-----+----+-----+---------//
+# | x8 |  y  | w8 |  h  | XOR data...
+# +----+-----+----+-----+---------//
+#
+# x8 and w8 are one byte each, and are the horizontal start and width
+# of the rectangle in bytes (8 pixels each), y and h are 16 bit. They
+# are followed by w8*h bytes of data to XOR into the framebuffer.
+#
+# Each frame is applied to the framebuffer while the display is still
+# refreshing the previous one, and then only the changed area is updated
+# with a partial update. Frames are played at a steady pace: every
+# 'frame_ms' milliseconds, or at the refresh time of the current display
+# speed if it is longer.
+class AnimationPlayer:
+    def __init__(self,eink,filename):
+        self.eink = eink
+        self.f = open(filename,"rb")
+        header = self.f.read(8)
+        width = (header[0] << 8) | header[1]
+        height = (header[2] << 8) | header[3]
+        self.frames = (header[4] << 8) | header[5]
+        self.frame_ms = (header[6] << 8) | header[7]
+        if width != eink.width or height != eink.height:
+            raise ValueError("Animation size does not match the display")
+        self.buf = bytearray(256) # Rect data, grown as needed.
+
+    # Read the next frame from the file and XOR it into the framebuffer.
+    # Return the region covering all the changed rectangles, or None
+    # if nothing changed.
+    def apply_frame(self):
+        f = self.f
+        fb = self.eink.raw_fb
+        stride = self.eink.width//8
+        rects = f.read(2)
+        rects = (rects[0] << 8) | rects[1]
+        x1 = y1 = 0xffff
+        x2 = y2 = 0
+        for i in range(rects):
+            r = f.read(6)
+            x8,y,w8,h = r[0],(r[1] << 8)|r[2],r[3],(r[4] << 8)|r[5]
+            size = w8*h
+            if size > len(self.buf): self.buf = bytearray(size)
+            mv = memoryview(self.buf)[:size]
+            f.readinto(mv)
+            xor_rect(fb,stride,mv,x8,y,w8,h)
+            x1 = min(x1,x8*8)
+            y1 = min(y1,y)
+            x2 = max(x2,(x8+w8)*8)
+            y2 = max(y2,y+h)
+        if rects == 0: return None
+        return (x1,y1,x2-x1,y2-y1)
+
+    # Play the animation 'loops' times (0 means forever). If 'frame_ms'
+    # is given, it overrides the frame duration stored in the file.
+    def play(self,loops=1,frame_ms=None):
+        eink = self.eink
+        if frame_ms == None: frame_ms = self.frame_ms
+        if eink.lut_duration_ms != None:
+            frame_ms = max(frame_ms,eink.lut_duration_ms)
+
+        loop = 0
+        deadline = time.ticks_ms()
+        while loops == 0 or loop < loops:
+            # The first frame is a delta from a white image: start
+            # again from a clear framebuffer, and update the whole display
+            # since the previous frame may be anything.
+            self.f.seek(8)
+            eink.fb.fill(0)
+            for frame in range(self.frames):
+                region = self.apply_frame()
+
+                # Wait for the previous frame refresh and for the time
+                # of the next frame. If we are late, we don't try to
+                # recover playing the next frames faster.
+                eink.wait_ready()
+                delay = time.ticks_diff(deadline,time.ticks_ms())
+                if delay > 0:
+                    time.sleep_ms(delay)
+                else:
+                    deadline = time.ticks_ms()
+                deadline = time.ticks_add(deadline,frame_ms)
+                if frame == 0:
+                    eink.update(blocking=False)
+                elif region != None:
+                    eink.update(blocking=False,region=region)
+            loop += 1
+        eink.wait_and_switch_off()
+
+    def close(self):
+        self.f.close()
@@ -0,0 +1,176 @@
+# Pre-rendered screens cache for the UC8151 / IL0373 e-paper driver.
+# See uc8151.py: ScreenCache can also be imported from there.
+#
+# Copyright(C) 2024 Salvatore Sanfilippo <antirez@gmail.com>
+# MIT license.
+
+# Compress 'n' bytes of 'src' into 'dst', that must be at least
+# n+n//128+1 bytes, and return the compressed length. The encoding
+# is a simple run length encoding (like PackBits), that works very well
+# for the big areas of the same color found in user interfaces:
+#
+# control byte 0-127: the next control+1 bytes are copied verbatim.
+# control byte 128-255: the next byte is repeated control-126 times.
+@micropython.viper
+def rle_encode(src:ptr8, n:int, dst:ptr8) -> int:
+    i = 0
+    o = 0
+    while i < n:
+        run = 1
+        while i+run < n and run < 129 and src[i+run] == src[i]: run += 1
+        if run >= 3:
+            dst[o] = run+126
+            dst[o+1] = src[i]
+            o += 2
+            i += run
+        else:
+            # Literal sequence: stop where a run of at least three bytes
+            # starts. Shorter runs are not worth it: encoding them alone
+            # would make the output larger than the input.
+            start = i
+            i += 1
+            while i < n and i-start < 128:
+                if i+2 < n and src[i] == src[i+1] and src[i] == src[i+2]:
+                    break
+                i += 1
+            dst[o] = i-start-1
+            o += 1
+            for j in range(start,i):
+                dst[o] = src[j]
+                o += 1
+    return o
+
+# Decompress 'n' bytes of 'src', encoded by rle_encode(), into 'dst'.
+@micropython.viper
+def rle_decode(src:ptr8, n:int, dst:ptr8):
+    i = 0
+    o = 0
+    while i < n:
+        c = src[i]
+        i += 1
+        if c < 128:
+            for j in range(c+1):
+                dst[o] = src[i]
+                o += 1
+                i += 1
+        else:
+            v = src[i]
+            i += 1
+            for j in range(c-126):
+                dst[o] = v
+                o += 1
+
+# Cache of pre-rendered screens, for user interfaces switching among
+# a few fixed screens (menus, pages, ...). Showing a cached screen
+# requires no drawing nor framebuffer copies in Python: the cached image
+# is transferred as it is, and the image of the screen currently displayed
+# is transferred as the old image (the chip has one buffer for the old
+# image and one for the new one), so that the waveforms cover exactly the
+# transition between the two screens.
+#
+# Up to 'size' screens are cached. When the cache is full, adding a new
+# screen evicts the least recently shown one ('policy' set to "lru") or
+# the oldest added ('policy' set to "fifo"). Screens are stored
+# compressed if 'compress' is True: this uses much less memory, but
+# costs a decompression at each show() and two buffers to decompress
+# the old and new image into.
+#
+# If a 'render' function is given, showing a screen that is not in
+# the cache calls render(screen_id, fb) to draw it into the framebuffer
+# 'fb' of the display, and the result is added to the cache. Otherwise
+# screens must be added with add() before being shown.
+class ScreenCache:
+    def __init__(self,eink,render=None,*,size=4,compress=False,policy="lru"):
+        if policy not in ("lru","fifo"):
+            raise ValueError("Cache policy must be 'lru' or 'fifo'")
+        if size < 1:
+            raise ValueError("Cache size must be at least 1")
+        self.eink = eink
+        self.render = render
+        self.size = size
+        self.compress = compress
+        self.policy = policy
+        self.screens = {} # Screen ID -> image (compressed or not).
+        self.order = [] # Screen IDs, the next to evict first.
+        self.last_sent = None # Buffer of the screen currently displayed.
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if compress:
+            fbsize = len(eink.raw_fb)
+            self.buffers = [bytearray(fbsize),bytearray(fbsize)]
+
+    # Add a screen to the cache, taking the image from 'fb' (a buffer
+    # with the same layout of the display raw_fb), or from the display
+    # framebuffer itself if not given. The image is copied, so the
+    # buffer can be reused later.
+    def add(self,screen_id,fb=None):
+        if fb == None: fb = self.eink.raw_fb
+        if self.compress:
+            tmp = bytearray(len(fb)+len(fb)//128+1)
+            clen = rle_encode(fb,len(fb),tmp)
+            image = bytes(memoryview(tmp)[:clen])
+        else:
+            image = bytes(fb)
+
+        self.remove(screen_id)
+        while len(self.order) >= self.size:
+            self.remove(self.order[0])
+            self.evictions += 1
+        self.screens[screen_id] = image
+        self.order.append(screen_id)
+
+    # Remove a screen from the cache, if present.
+    def remove(self,screen_id):
+        if screen_id in self.screens:
+            del self.screens[screen_id]
+            self.order.remove(screen_id)
+
+    # Remove all the screens from the cache.
+    def clear(self):
+        self.screens = {}
+        self.order = []
+
+    # Show the specified screen, rendering and caching it if needed.
+    # 'blocking' has the same meaning as in UC8151.update(), and so does
+    # the return value.
+    def show(self,screen_id,blocking=True):
+        image = self.screens.get(screen_id)
+        if image != None:
+            self.hits += 1
+            if self.policy == "lru":
+                self.order.remove(screen_id)
+                self.order.append(screen_id)
+        else:
+            self.misses += 1
+            if self.render == None:
+                raise KeyError(screen_id)
+            self.render(screen_id,self.eink.fb)
+            self.add(screen_id)
+            image = self.screens[screen_id]
+
+        # If the last image sent to the display is still the one of our
+        # last shown screen, we know the old image to transfer. Otherwise
+        # something else was displayed in the meantime, and we just
+        # let the display use what it has in memory.
+        old = self.last_sent if self.eink.last_image is self.last_sent else None
+        if self.compress:
+            new = self.buffers[1] if old is self.buffers[0] else self.buffers[0]
+            rle_decode(image,len(image),new)
+        else:
+            new = image
+
+        if not self.eink.update(blocking=blocking,fb=new,old_fb=old):
+            return False
+        self.last_sent = new
+        return True
+
+    # Return the cache statistics as a dictionary.
+    def stats(self):
+        used = 0
+        for image in self.screens.values(): used += len(image)
+        return {"hits":self.hits,
+                "misses":self.misses,
+                "evictions":self.evictions,
+                "screens":len(self.screens),
+                "bytes":used}
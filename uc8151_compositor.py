@@ -0,0 +1,167 @@
+# Layers compositor for the UC8151 / IL0373 e-paper driver.
+# See uc8151.py: Layer and Compositor can also be imported from there.
+#
+# Copyright(C) 2024 Salvatore Sanfilippo <antirez@gmail.com>
+# MIT license.
+
+import framebuf
+
+# Blit the rows sy..sy+h-1 of the MONO_HLSB layer 'src' ('sstride' bytes
+# per row, 'sw' pixels wide, placed at display x coordinate 'dx') into
+# the display framebuffer 'dst' at rows dy..dy+h-1, byte columns x8 to
+# x8+w8-1. The layer can be at any x, not just multiples of 8: each
+# destination byte is assembled from the two source bytes it overlaps,
+# and 'mask' selects the bits that are actually part of the layer.
+# Opaque layers replace the destination bits, otherwise only the set
+# (black) bits of the layer are drawn.
+@micropython.viper
+def blit_layer(dst:ptr8, dstride:int, src:ptr8, sstride:int, sw:int, dx:int, x8:int, w8:int, dy:int, sy:int, h:int, opaque:int):
+    for i in range(h):
+        drow = (dy+i)*dstride+x8
+        srow = (sy+i)*sstride
+        for c in range(w8):
+            px = (x8+c)*8-dx # Layer pixel at the start of this byte.
+            if px >= 0:
+                b = srow+(px >> 3)
+                v = src[b] << 8
+                if (px >> 3)+1 < sstride: v |= src[b+1]
+                bits = ((v << (px & 7)) >> 8) & 0xff
+                mask = 0xff
+            else:
+                bits = src[srow] >> (0-px)
+                mask = 0xff >> (0-px)
+            if px+8 > sw: mask &= (0xff << (px+8-sw)) & 0xff
+            bits &= mask
+            if opaque:
+                dst[drow+c] = (dst[drow+c] & (mask ^ 0xff)) | bits
+            else:
+                dst[drow+c] |= bits
+
+# Return the smallest rectangle containing the two (x,y,w,h) rectangles.
+def union(a,b):
+    x = min(a[0],b[0])
+    y = min(a[1],b[1])
+    x2 = max(a[0]+a[2],b[0]+b[2])
+    y2 = max(a[1]+a[3],b[1]+b[3])
+    return (x,y,x2-x,y2-y)
+
+# A layer is a 1 bit image (MONO_HLSB, like the display framebuffer)
+# with a position on the display and a z-order: layers with greater 'z'
+# are drawn on top. Opaque layers cover whatever is below them in their
+# rectangle, while transparent layers only draw their black pixels.
+#
+# Draw into the layer using its 'fb' FrameBuffer, then call mark_dirty()
+# (optionally with the changed region, in layer coordinates) so that the
+# compositor knows what to draw again at the next update.
+class Layer:
+    def __init__(self,width,height,x=0,y=0,*,z=0,transparent=False):
+        self.width = width
+        self.height = height
+        self.x = x
+        self.y = y
+        self.z = z
+        self.transparent = transparent
+        self.visible = True
+        self.buf = bytearray((width+7)//8*height)
+        self.fb = framebuf.FrameBuffer(self.buf,width,height,framebuf.MONO_HLSB)
+        self.shown = None # Display rectangle where the layer was drawn.
+        self.dirty = (0,0,width,height) # Area to draw again, if any.
+
+    # Flag the given region of the layer (or all of it) as changed.
+    def mark_dirty(self,region=None):
+        if region == None: region = (0,0,self.width,self.height)
+        self.dirty = region if self.dirty == None else union(self.dirty,region)
+
+    def move(self,x,y):
+        self.x = x
+        self.y = y
+        self.mark_dirty()
+
+    def set_visible(self,visible):
+        self.visible = visible
+        self.mark_dirty()
+
+    def rect(self):
+        return (self.x,self.y,self.width,self.height)
+
+# The compositor owns the display framebuffer, and draws into it the
+# layers added, in z-order. At each update() only the areas that changed
+# are composited again (the changed areas of the layers, and the old and
+# new position of moved or hidden layers): each area is cleared and
+# only the layers intersecting it are blitted, clipped to the area. Then
+# the display is updated with a partial update of the union of the areas,
+# so both the CPU time and the data transferred depend on what changed,
+# not on the number and size of the layers.
+#
+# The first update draws the whole display. Areas not covered by any
+# layer are white: use an opaque layer with z=0 for a background.
+class Compositor:
+    def __init__(self,eink):
+        self.eink = eink
+        self.layers = []
+        self.damage = [(0,0,eink.width,eink.height)] # Areas to redraw.
+
+    def add(self,layer):
+        self.layers.append(layer)
+        layer.shown = None
+        layer.mark_dirty()
+
+    def remove(self,layer):
+        self.layers.remove(layer)
+        if layer.shown != None: self.damage.append(layer.shown)
+
+    # Collect the display areas to composite again, aligned to
+    # 8 pixels horizontally.
+    def dirty_areas(self):
+        areas = list(self.damage)
+        for l in self.layers:
+            if l.dirty == None: continue
+            if l.shown != None and (l.visible == False or l.shown != l.rect()):
+                areas.append(l.shown)
+            if l.visible:
+                x,y,w,h = l.dirty
+                areas.append((l.x+x,l.y+y,w,h))
+        aligned = []
+        for r in areas:
+            r = self.eink.align_region(r)
+            if r != None: aligned.append(r)
+        return aligned
+
+    # Clear the display area 'r' and draw in it the layers overlapping it.
+    def composite(self,r):
+        eink = self.eink
+        x,y,w,h = r
+        eink.fb.fill_rect(x,y,w,h,0)
+        for l in self.layers:
+            if l.visible == False: continue
+            # Intersect the area with the layer rectangle.
+            y1 = max(y,l.y)
+            y2 = min(y+h,l.y+l.height)
+            x1 = max(x,l.x) & ~7
+            x2 = (min(x+w,l.x+l.width)+7) & ~7
+            if y2 <= y1 or x2 <= x1: continue
+            blit_layer(eink.raw_fb,eink.width//8,l.buf,(l.width+7)//8,l.width,
+                       l.x,x1//8,(x2-x1)//8,y1,y1-l.y,y2-y1,
+                       0 if l.transparent else 1)
+
+    # Composite the changed areas and update them on the display.
+    # 'blocking' and the return value have the same meaning as in
+    # UC8151.update(): if the display is busy with a non blocking update,
+    # nothing is done, and the changes are drawn at the next call.
+    def update(self,blocking=True):
+        eink = self.eink
+        if blocking == False and eink.is_busy(): return False
+        self.layers.sort(key=lambda l: l.z)
+        areas = self.dirty_areas()
+        self.damage = []
+        for l in self.layers:
+            if l.dirty == None: continue
+            l.dirty = None
+            l.shown = l.rect() if l.visible else None
+        if len(areas) == 0: return True # Nothing changed.
+
+        region = areas[0]
+        for r in areas:
+            self.composite(r)
+            region = union(region,r)
+        return eink.update(blocking=blocking,region=region)
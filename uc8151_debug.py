@@ -0,0 +1,81 @@
+# Debugging and LUT experimentation tools for the UC8151 / IL0373
+# e-paper driver. See uc8151.py: these functions are called by the UC8151
+# methods with the same name, and the module is imported only when needed.
+#
+# Copyright(C) 2024 Salvatore Sanfilippo <antirez@gmail.com>
+# MIT license.
+
+from uc8151 import CMD_LUT_VCOM, CMD_LUT_WW, CMD_LUT_BW, CMD_LUT_WB, CMD_LUT_BB
+
+# This function is only for debugging. We use computed LUTs, however
+# it is quite handy in order to experiment with different display
+# capabilities to play with the tables by hand and quickly check the
+# results. It lives in this module, imported only when needed, since
+# the tables use a lot of MicroPython memory.
+#
+# P.S. the currently set LUTs in the tables are just trivial
+# examples and don't have any special use.
+def set_handmade_lut(eink):
+    VCOM = bytes([
+      0x00, 0x01, 0x01, 0x02, 0x00, 0x01,
+      0x00, 0x02, 0x02, 0x03, 0x00, 0x02,
+      0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+      0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+      0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+      0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+      0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+      0x00, 0x00
+    ])
+    BW = bytes([
+      0x99, 0x02, 0x02, 0x00, 0x00, 0x01,
+      0xaa, 0x02, 0x02, 0x03, 0x00, 0x02,
+      0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+      0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+      0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+      0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+      0x00, 0x00, 0x00, 0x00, 0x00, 0x00
+    ])
+    WB = bytes([
+      0x66, 0x02, 0x02, 0x00, 0x00, 0x01,
+      0x55, 0x02, 0x02, 0x03, 0x00, 0x02,
+      0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+      0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+      0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+      0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+      0x00, 0x00, 0x00, 0x00, 0x00, 0x00
+    ])
+    WW = bytes([
+      0b01_10_0000, 0x08, 0x08, 0x00, 0x00, 0x01,
+      0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+      0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+      0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+      0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+      0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+      0x00, 0x00, 0x00, 0x00, 0x00, 0x00
+    ])
+    BB = bytes([
+      0b10_01_0000, 0x08, 0x08, 0x00, 0x00, 0x01,
+      0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+      0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+      0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+      0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+      0x00, 0x00, 0x00, 0x00, 0x00, 0x00,
+      0x00, 0x00, 0x00, 0x00, 0x00, 0x00
+    ])
+    eink.write(CMD_LUT_VCOM,VCOM)
+    eink.write(CMD_LUT_BW,BW)
+    eink.write(CMD_LUT_WB,WB)
+    eink.write(CMD_LUT_BB,BB)
+    eink.write(CMD_LUT_WW,WW)
+
+# Show a well-formatted LUT table. Useful for debugging.
+def show_lut(lut,name):
+    print(name,":")
+    for i in range(7):
+        if i > 0 and lut[i*6] == 0: break
+        print(bin(lut[i*6]|256)[3:],end=' ')
+        for j in range(1,6):
+            print(hex(lut[i*6+j]),end=' ')
+        print("")
+    print("---")
+
@@ -0,0 +1,407 @@
+# Greyscale rendering for the UC8151 / IL0373 e-paper driver.
+# See uc8151.py: these functions are called by the UC8151 methods
+# with the same name, and the module is imported only when needed.
+#
+# Copyright(C) 2024 Salvatore Sanfilippo <antirez@gmail.com>
+# MIT license.
+
+from uc8151 import CMD_LUT_VCOM, CMD_LUT_WW, CMD_LUT_BW, CMD_LUT_WB, CMD_LUT_BB, CMD_DRF
+
+# Helper function to render greyscale images.
+#
+# This function has to generate two one-bit images, using the two
+# framebuffers fb1 and fb2. For three grey levels, we set the
+# before/after bits in order to trigger the WW/BB/WB conditions,
+# so that we assign to each of this LUTs the waveform needed to
+# generate a different level of grey. We use BW for pixels that
+# should not be toched (either set in past iterations or yet to be
+# set with a different level of grey than level,level+1,level+2).
+# 
+# Using this trick, we can set the pixels of three different levels
+# of greys in the same update. The image to render should be in
+# 'grey', where each byte maps to a pixel: higher values means
+# a more lighter level of grey.
+#
+# The three level of greys that this function will match are
+# given by 'level': from level to level+2 inclusive.
+@micropython.viper
+def set_pixels_for_greyscale(grey:ptr8, fb1:ptr8, fb2:ptr8, width:int, height:int, shift:int, level:int) -> int:
+    count = int(width*height)
+    anypixel = int(0)
+    for i in range(count//8):
+        fb1[i] = 0
+        fb2[i] = 0
+
+    for i in range(count):
+        # Pixel that reached level "1" are the only ones at the
+        # current grey level we want to set.
+        byte = i >> 3
+        bit = 1 << (7-(i&7))
+
+        # Given that a greater value of the pixel means lighter
+        # pixels, but for the display more frames to turn this pixel
+        # towards black is the reverse, we invert the pixel value.
+        # We also need to scale it from 0-255 to 0-(greys-1).
+        converted = (255-grey[i]) >> shift # Invert and rescale.
+        if converted == level:        # WW condition
+            anypixel = 1
+            pass
+        elif converted == level+1:    # BB condition
+            anypixel = 1
+            fb1[byte] |= bit
+            fb2[byte] |= bit
+        elif converted == level+2:    # WB condition
+            anypixel = 1
+            fb1[byte] |= bit
+        else:                   # BW condition, pixels not touched.
+            fb2[byte] |= bit
+    return anypixel
+
+# Load and render the greyscale image specified. The
+# image format must be: 4 bytes WWHH width,height
+# unsigned 16 bit, big endian. Followed by width*height
+# bytes. Each byte is a pixel with color 0 (black) to
+# 255 (white).
+def load_greyscale_image(eink,filename,greyscale=16,threaded=False):
+    # Read image data.
+    f = open(filename,"rb")
+    f.read(4)
+    imgdata = bytearray(eink.width*eink.height)
+    f.readinto(imgdata)
+    print("Image max luminance:",max(imgdata))
+    update_greyscale(eink,imgdata,greyscale,threaded)
+
+# Helper for blit_greyscale_image(): convert 'count' greyscale pixels
+# of 'row' into 1 bit pixels of the MONO_HLSB framebuffer 'fb',
+# starting at pixel index 'off' (y*width+x). Pixels darker than
+# 'threshold' are set (black), the others are cleared (white).
+@micropython.viper
+def threshold_greyscale_row(row:ptr8, fb:ptr8, off:int, count:int, threshold:int):
+    for i in range(count):
+        p = off+i
+        bit = 1 << (7-(p&7))
+        if row[i] < threshold:
+            fb[p>>3] |= bit
+        else:
+            fb[p>>3] &= 0xff ^ bit
+
+# Blit a window of a gs8 image at x,y. The image is copied
+# into 'canvas', a GS8 buffer of width*height bytes like the one
+# update_greyscale() expects, or, if no canvas is given, into the 1 bit
+# framebuffer 'fb', where the pixels darker than 'threshold' are
+# set to black and the others to white.
+#
+# 'src' is either a filename or a buffer with a gs8 image (header
+# included). Files are read one row at a time, seeking to the start
+# of each row of the window, so the image is never loaded as a whole:
+# many icons or sprites can live in a single file without wasting RAM.
+#
+# sx,sy,w,h select the window of the source image to copy (by default
+# the whole image). The window is clipped to both the source image
+# and the display area.
+def blit_greyscale_image(eink,src,x,y,*,sx=0,sy=0,w=None,h=None,canvas=None,threshold=128):
+    if isinstance(src,str):
+        f = open(src,"rb")
+        header = f.read(4)
+    else:
+        f = None
+        header = src
+    img_width = (header[0] << 8) | header[1]
+    img_height = (header[2] << 8) | header[3]
+
+    # Clip the window to the source image, then to the display.
+    if w == None: w = img_width-sx
+    if h == None: h = img_height-sy
+    w = min(w,img_width-sx)
+    h = min(h,img_height-sy)
+    if x < 0:
+        sx -= x
+        w += x
+        x = 0
+    if y < 0:
+        sy -= y
+        h += y
+        y = 0
+    w = min(w,eink.width-x)
+    h = min(h,eink.height-y)
+
+    if w > 0 and h > 0:
+        row = bytearray(w) if f else None
+        srcview = None if f else memoryview(src)
+        for i in range(h):
+            off = 4+(sy+i)*img_width+sx
+            if f:
+                f.seek(off)
+                f.readinto(row)
+            else:
+                row = srcview[off:off+w]
+            dst = (y+i)*eink.width+x
+            if canvas != None:
+                canvas[dst:dst+w] = row
+            else:
+                threshold_greyscale_row(row,eink.raw_fb,dst,w,threshold)
+    if f: f.close()
+
+# Update the display in greyscale "faked mode" using the image
+# into the framebuffer "buffer". The buffer should be width*height
+# pixels (depending on the display size) bytes. Each byte has
+# a value in the range 0-255, from black to white.
+#
+# If 'threaded' is True, the bitplanes for the next pass are computed
+# by a Worker (see uc8151_worker.py, needed only in this case) on the
+# second core, while the current pass is transferred and refreshed.
+# This needs two more framebuffers. Otherwise the bitplanes are computed
+# while the display is refreshing the previous pass.
+def update_greyscale(eink,buffer,greyscale,threaded=False):
+    greyscales = [32,16,8,4] # Must be power of 2.
+    frames_to_black = 32 # Frames needed to go from white to black, using
+                         # a too large number may damage the display, but
+                         # using a bit larger number may improve contrast.
+
+    # The frames above are at 100 HZ: scale them to keep the same timing
+    # with other PLL frequencies.
+    frames_to_black = frames_to_black*eink.frequency//100
+
+    if greyscale not in greyscales:
+        raise ValueError("Unsupproted greyscale")
+
+    # Amount of right shifting to convert 0-255 grey value to
+    # 0-(greyscale-1) value.
+    shift = 3+greyscales.index(greyscale)
+
+    # Prepare the display: we want it to be white, and we want the
+    # registers LUTs to be selected (all speeds but speed 0).
+    orig_speed = eink.speed
+    orig_no_flickering = eink.no_flickering
+
+    eink.set_speed(2,no_flickering=True)
+    eink.fb.fill(0)
+    eink.update(blocking=True) # All screen white
+
+    # Now for each level of grey in the image, create a bitmap composed
+    # only of pixels of that level of grey, and create an ad-hoc LUT
+    # that polarizes pixels towards black for an amount of time (frames)
+    # proportional to the grey level.
+    #
+    # The bitplanes of each pass are computed while the previous pass
+    # is refreshing. With threads, the worker writes into a different
+    # pair of framebuffers than the ones of the pass being transferred.
+    worker = None
+    if threaded:
+        from uc8151_worker import Worker
+        worker = Worker()
+    fbsize = eink.width*eink.height//8
+    planes = [(eink.raw_fb,bytearray(fbsize))]
+    if worker and worker.threaded:
+        planes.append((bytearray(fbsize),bytearray(fbsize)))
+    levels = range(0,greyscale,3)
+
+    # Resort to a faster method in Viper to set the pixels for the
+    # greyscale levels of the given pass.
+    def prepare(i):
+        fb1,fb2 = planes[i%len(planes)]
+        return set_pixels_for_greyscale(buffer,fb1,fb2,eink.width,eink.height,shift,levels[i]+1)
+
+    try:
+        anypixel = prepare(0)
+        for i in range(len(levels)):
+            g = levels[i]
+            fb1,fb2 = planes[i%len(planes)]
+            if worker and i+1 < len(levels): worker.submit(prepare,i+1)
+            if anypixel:
+                # Transfer the "old" image, so that for difference
+                # with the new we transfer via .update() we create
+                # the four set of conditions (WW, BB, WB, BW) based
+                # on the difference between the bits in the two
+                # images.
+                eink.send_image(fb2,old=True)
+
+                # We set the framebuffer with just the pixels of the level
+                # of grey we are handling in this cycle, so now we apply
+                # the voltage for a time proportional to this level.
+                set_pass_luts(eink,*pass_durations(frames_to_black,greyscale,g))
+
+                # Finally update. We don't block, so that the worker
+                # can prepare the next pass during the refresh.
+                eink.update(blocking=False,fb=fb1)
+            if i+1 < len(levels):
+                anypixel = worker.wait() if worker else prepare(i+1)
+            eink.wait_and_switch_off()
+    finally:
+        if worker: worker.stop() # Free the second core.
+
+    end_greyscale(eink,orig_speed,orig_no_flickering)
+
+# Return the LUT durations (ww,bb,wb,vcom) of the greyscale pass that
+# handles the levels g+1 to g+3, see update_greyscale(). 'frames_to_black'
+# must be already scaled for the PLL frequency. Durations must fit in
+# the LUT bytes: too long passes raise an error instead of being clipped.
+def pass_durations(frames_to_black,greyscale,g):
+    d = (int(frames_to_black/(greyscale-1)*(g+1)),
+         int(frames_to_black/(greyscale-1)*(g+2)),
+         int(frames_to_black/(greyscale-1)*(g+3)),
+         int(frames_to_black/greyscale*(g+3)))
+    if max(d) > 255: raise ValueError("Greyscale pass too long for the LUTs")
+    return d
+
+# Write the LUTs for a greyscale pass: the pixels in the WW, BB and WB
+# conditions are polarized towards black for 'ww', 'bb' and 'wb' frames,
+# while BW pixels are not touched. 'vcom' is the duration of the VCOM LUT.
+def set_pass_luts(eink,ww,bb,wb,vcom):
+    # Nothing to do for white pixels or already black pixels.
+    # Set an empty LUT.
+    LUT = bytearray(42)
+    VCOM = bytearray(44)
+
+    LUT[0] = 0x55 # Go black
+    LUT[5] = 1 # Repeat 1 for all
+    LUT[1] = ww
+    eink.write(CMD_LUT_WW,LUT)
+    LUT[1] = bb
+    eink.write(CMD_LUT_BB,LUT)
+    LUT[1] = wb
+    eink.write(CMD_LUT_WB,LUT)
+    LUT[1] = 0 # These pixels will be unaffected, none of them
+               # is of the three colors handled in this cycle.
+    LUT[5] = 0
+    eink.write(CMD_LUT_BW,LUT)
+
+    # Minimal VCOM LUT to avoid any unneeded wait.
+    VCOM[0] = 0 # Already zero, just to make it obvious.
+    VCOM[1] = vcom
+    VCOM[5] = 1
+    eink.write(CMD_LUT_VCOM,VCOM)
+
+# Restore a normal LUT based on the speed configured before rendering
+# the greyscale image. The framebuffer was used for the bitplanes: clear
+# it, so that it is ready to draw an overlay to show with update_overlay().
+def end_greyscale(eink,speed,no_flickering):
+    eink.set_speed(speed,no_flickering=no_flickering)
+    eink.wait_and_switch_off()
+    eink.fb.fill(0)
+    eink.overlay_fb = None
+
+# Load and render a file of precomputed greyscale passes, generated by
+# the gs8planes tool (see the gs8planes directory). This is like
+# update_greyscale(), but the bitplanes of each pass were computed on
+# the host, so the device just streams them from the file to the
+# display. The file format is the following:
+#
+# +-------+--------+--------+-----------+-----------------+----------//
+# | width | height | passes | greyscale | frames_to_black | Passes...
+# +-------+--------+--------+-----------+-----------------+----------//
+#
+# All the header fields are big endian unsigned 16 bit integers.
+# 'frames_to_black' is at 100 HZ, like in update_greyscale().
+# Each pass is:
+#
+# +-------+-----+-----+
+# | level | fb1 | fb2 |
+# +-------+-----+-----+
+#
+# 'level' is one byte: the pass handles the grey levels level+1 to
+# level+3, like the passes of update_greyscale(). fb1 and fb2 are
+# width*height/8 bytes each, the new and old image as computed by
+# set_pixels_for_greyscale(). The LUT durations of each pass are
+# computed with pass_durations(), exactly like update_greyscale() does
+# at the configured PLL frequency.
+#
+# The next pass is read from the file while the display is refreshing
+# the current one: once the images are transferred the buffers can be
+# reused, so only one framebuffer is allocated besides raw_fb.
+def load_greyscale_planes(eink,filename):
+    f = open(filename,"rb")
+    header = f.read(10)
+    width = (header[0] << 8) | header[1]
+    height = (header[2] << 8) | header[3]
+    passes = (header[4] << 8) | header[5]
+    greyscale = (header[6] << 8) | header[7]
+    frames_to_black = ((header[8] << 8) | header[9])*eink.frequency//100
+    if width != eink.width or height != eink.height:
+        f.close()
+        raise ValueError("Image size does not match the display")
+    try:
+        # Check the durations before starting: the last pass is the
+        # longest one.
+        pass_durations(frames_to_black,greyscale,(greyscale-1)//3*3)
+    except ValueError:
+        f.close()
+        raise
+
+    # Start from a white display, like update_greyscale().
+    orig_speed = eink.speed
+    orig_no_flickering = eink.no_flickering
+    eink.set_speed(2,no_flickering=True)
+    eink.fb.fill(0)
+    eink.update(blocking=True)
+
+    fb1 = eink.raw_fb
+    fb2 = bytearray(len(fb1))
+    level = bytearray(1)
+    if passes:
+        f.readinto(level)
+        f.readinto(fb1)
+        f.readinto(fb2)
+    for i in range(passes):
+        eink.send_image(fb2,old=True)
+        set_pass_luts(eink,*pass_durations(frames_to_black,greyscale,level[0]))
+        eink.update(blocking=False,fb=fb1)
+        if i+1 < passes:
+            f.readinto(level)
+            f.readinto(fb1)
+            f.readinto(fb2)
+        eink.wait_and_switch_off()
+    f.close()
+    end_greyscale(eink,orig_speed,orig_no_flickering)
+
+# Show black and white pixels on top of a greyscale image displayed
+# with update_greyscale(), without rendering the greys again. The overlay
+# is taken from 'fb' (by default the display framebuffer): set pixels are
+# black, the others are transparent.
+#
+# We transfer the previous overlay as the old image and the new overlay
+# as the new image, and use the no flickering LUTs of the given speed:
+# WW and BB pixels (all the pixels not changing in the overlay) are left
+# grounded, so the grey image below is untouched. Pixels added to the
+# overlay go black, pixels removed from it go white (the grey level below
+# is lost): so captions and alike are best drawn on white areas of the
+# image. The cost is a single fast refresh.
+#
+# 'blocking' and the return value have the same meaning as in update(),
+# and 'region' can be used to transfer and refresh just the area where
+# the overlay changed.
+def update_overlay(eink,fb=None,*,speed=4,blocking=True,region=None):
+    if fb == None: fb = eink.raw_fb
+    if region != None:
+        region = eink.align_region(region)
+        if region == None: return True # Nothing to update.
+    if blocking == False and eink.is_busy(): return False
+    old = eink.overlay_fb
+    if old == None: old = bytearray(len(fb)) # No overlay shown yet.
+
+    # At speed 0 the panel is configured to use the OTP LUTs: select
+    # the LUTs in the registers for this refresh.
+    eink.restore_waveform_lut()
+    if eink.speed == 0: eink.set_panel_configuration(speed)
+    eink.set_waveform_lut(speed,True)
+    eink.send_image(old,old=True,region=region)
+    eink.send_image(fb,region=region)
+    eink.write(CMD_DRF) # Start refresh cycle.
+
+    # Remember the overlay, reusing the previous buffer if any. With
+    # a region, only the part that was transferred is now displayed.
+    if eink.overlay_fb == None: eink.overlay_fb = old
+    if region == None:
+        eink.overlay_fb[:] = fb
+    else:
+        x,y,w,h = region
+        stride = eink.width//8
+        for row in range(y,y+h):
+            off = row*stride+x//8
+            eink.overlay_fb[off:off+w//8] = fb[off:off+w//8]
+
+    # Load back the configured LUTs and panel configuration once the
+    # refresh is done.
+    eink.lut_restore_pending = True
+    if blocking: eink.wait_and_switch_off()
+    return True
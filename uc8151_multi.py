@@ -0,0 +1,70 @@
+# Multiple displays support for the UC8151 / IL0373 e-paper driver.
+# See uc8151.py: MultiUC8151 can also be imported from there.
+#
+# Copyright(C) 2024 Salvatore Sanfilippo <antirez@gmail.com>
+# MIT license.
+
+# Drive multiple displays connected to the same SPI bus. Each display
+# needs its own CS and BUSY pins, while the DC line can be shared, and
+# so can the RST line if it is given only to the first display created
+# (otherwise each initialization would reset the displays already set up).
+# With a shared RST line, displays in deep sleep are woken up all together
+# by resume(), since the reset affects all of them.
+#
+# Refreshing an e-paper display takes a long time, but the SPI bus
+# is only needed to transfer commands and the image. So while a display
+# is refreshing we transfer the image to the next one, and the time
+# needed to update all the displays gets near to the time of the slowest
+# display, instead of the sum of all the refresh times.
+class MultiUC8151:
+    def __init__(self,displays):
+        self.displays = displays
+        shared = [d for d in displays if d.rst == None]
+        if shared and len(shared) < len(displays):
+            for d in displays: d.reset_group = self
+
+    # Return true if any of the displays is busy.
+    def is_busy(self):
+        for d in self.displays:
+            if d.is_busy(): return True
+        return False
+
+    # Update the displays with the content of their framebuffers. If
+    # 'which' is given, only the displays with the specified indexes
+    # are updated. Displays still busy with a previous refresh are
+    # skipped and retried later, so that the others can start in the
+    # meantime.
+    #
+    # If blocking is True, the function waits for all the displays to
+    # complete the update and switches them off, otherwise this should
+    # be done later with wait_and_switch_off().
+    def update(self,which=None,blocking=True):
+        if which == None: which = range(len(self.displays))
+        updated = [self.displays[i] for i in which]
+        pending = updated[:]
+        while pending:
+            for d in pending[:]:
+                if d.update(blocking=False): pending.remove(d)
+        if blocking: self.wait_and_switch_off(updated)
+
+    # Wait for the displays (all of them, or just the ones in the
+    # 'displays' list) to complete the refresh, and switch them off.
+    def wait_and_switch_off(self,displays=None):
+        if displays == None: displays = self.displays
+        for d in displays: d.wait_and_switch_off()
+
+    # Put all the displays in deep sleep, see UC8151.sleep().
+    def sleep(self):
+        for d in self.displays: d.sleep()
+
+    # Wake up the displays from deep sleep. This is called automatically
+    # when a command is sent to any of the displays in deep sleep: since
+    # the reset line is shared, all the displays are reset, so all of them
+    # have their registers set again, even the ones that were not sleeping.
+    def resume(self):
+        for d in self.displays: d.wait_ready()
+        for d in self.displays: d.sleeping = False
+        for d in self.displays:
+            if d.rst != None: d.reset()
+        for d in self.displays: d.restore_registers()
+
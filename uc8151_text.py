@@ -0,0 +1,146 @@
+# Rotated text rendering for the UC8151 / IL0373 e-paper driver.
+# See uc8151.py: text() is called by UC8151.text(), and the module is
+# imported only when needed.
+#
+# Copyright(C) 2024 Salvatore Sanfilippo <antirez@gmail.com>
+# MIT license.
+
+import framebuf
+
+# Bitmap font used by UC8151.text(). Without a filename the MicroPython
+# built-in 8x8 font is used, otherwise the font is loaded from a file
+# with the following format:
+#
+# +-------+--------+-------+------+----------//
+# | width | height | first | last | Glyphs...
+# +-------+--------+-------+------+----------//
+#
+# Each header field is one byte. Glyphs are stored one after the other
+# for the characters from 'first' to 'last' inclusive, each as a
+# MONO_HLSB bitmap of 'height' rows of (width+7)//8 bytes.
+#
+# Glyphs are rotated the first time they are drawn in a given
+# orientation and kept in a cache of up to 'cache_size' entries, so
+# drawing text is just a matter of copying bitmaps.
+class BitmapFont:
+    def __init__(self,filename=None,cache_size=128):
+        self.cache = {}
+        self.cache_size = cache_size
+        if filename == None:
+            self.width = 8
+            self.height = 8
+            self.first = 32
+            self.last = 127
+            self.data = None
+        else:
+            f = open(filename,"rb")
+            header = f.read(4)
+            self.width = header[0]
+            self.height = header[1]
+            self.first = header[2]
+            self.last = header[3]
+            self.data = f.read()
+            f.close()
+
+    # Return the unrotated bitmap of the glyph for the character code 'c'.
+    def glyph_bitmap(self,c):
+        if c < self.first or c > self.last: c = self.first
+        if self.data == None:
+            bitmap = bytearray(8)
+            fb = framebuf.FrameBuffer(bitmap,8,8,framebuf.MONO_HLSB)
+            fb.text(chr(c),0,0,1)
+            return bitmap
+        size = ((self.width+7)//8)*self.height
+        off = (c-self.first)*size
+        return self.data[off:off+size]
+
+    # Return the bitmap of the glyph for the character code 'c' rotated
+    # clockwise by 'rotation' degrees (0, 90, 180 or 270), as a
+    # (bitmap, width, height) tuple. Rotated glyphs are cached.
+    def glyph(self,c,rotation):
+        key = c*4+rotation//90
+        g = self.cache.get(key)
+        if g: return g
+
+        w,h = self.width,self.height
+        src = self.glyph_bitmap(c)
+        if rotation == 0:
+            g = (src,w,h)
+        else:
+            # For 90 and 270 degrees width and height are swapped.
+            rw,rh = (w,h) if rotation == 180 else (h,w)
+            dst = bytearray(((rw+7)//8)*rh)
+            sstride = (w+7)//8
+            dstride = (rw+7)//8
+            for sy in range(h):
+                for sx in range(w):
+                    if not src[sy*sstride+(sx>>3)] & (0x80 >> (sx&7)):
+                        continue
+                    if rotation == 90:
+                        dx,dy = h-1-sy,sx
+                    elif rotation == 180:
+                        dx,dy = w-1-sx,h-1-sy
+                    else:
+                        dx,dy = sy,w-1-sx
+                    dst[dy*dstride+(dx>>3)] |= 0x80 >> (dx&7)
+            g = (dst,rw,rh)
+
+        # The cache is small and glyphs are cheap to compute again: when
+        # it is full we just start again with an empty one.
+        if len(self.cache) >= self.cache_size: self.cache = {}
+        self.cache[key] = g
+        return g
+
+# Copy the glyph bitmap 'glyph' (MONO_HLSB, gw x gh pixels) into
+# the framebuffer 'fb' at x,y, clipping it to the framebuffer size.
+# Only the pixels set in the glyph are drawn, with the given color.
+@micropython.viper
+def blit_glyph(fb:ptr8, width:int, height:int, glyph:ptr8, gw:int, gh:int, x:int, y:int, color:int):
+    gstride = (gw+7) >> 3
+    stride = width >> 3
+    for gy in range(gh):
+        py = y+gy
+        if py < 0 or py >= height: continue
+        for gx in range(gw):
+            px = x+gx
+            if px < 0 or px >= width: continue
+            if glyph[gy*gstride+(gx>>3)] & (0x80 >> (gx&7)):
+                bit = 0x80 >> (px&7)
+                if color:
+                    fb[py*stride+(px>>3)] |= bit
+                else:
+                    fb[py*stride+(px>>3)] &= 0xff ^ bit
+
+# Draw the string 's' into 'fb' rotated clockwise by 'rotation'
+# degrees (0, 90, 180 or 270), so that landscape user interfaces don't
+# need to rotate the framebuffer. x,y is the top-left corner of the
+# area covered by the text once rotated: with 90 degrees the text
+# goes from top to bottom, with 270 from bottom to top. If no 'font'
+# is given, the built-in 8x8 font is used.
+#
+# Returns the width and height of the area covered by the text.
+def text(eink,s,x,y,color=1,*,rotation=0,font=None):
+    if rotation not in (0,90,180,270):
+        raise ValueError("Rotation must be 0, 90, 180 or 270")
+    if font == None:
+        if eink.font == None: eink.font = BitmapFont()
+        font = eink.font
+
+    length = len(s)*font.width
+    for i in range(len(s)):
+        glyph,gw,gh = font.glyph(ord(s[i]),rotation)
+        adv = i*font.width
+        if rotation == 0:
+            gx,gy = x+adv,y
+        elif rotation == 90:
+            gx,gy = x,y+adv
+        elif rotation == 180:
+            gx,gy = x+length-adv-font.width,y
+        else:
+            gx,gy = x,y+length-adv-font.width
+        blit_glyph(eink.raw_fb,eink.width,eink.height,glyph,gw,gh,gx,gy,color)
+
+    if rotation == 0 or rotation == 180:
+        return length,font.height
+    return font.height,length
+
@@ -0,0 +1,135 @@
+# Background work on the second core for the UC8151 / IL0373 e-paper
+# driver, see uc8151.py.
+#
+# Copyright(C) 2024 Salvatore Sanfilippo <antirez@gmail.com>
+# MIT license.
+
+try:
+    import _thread
+except ImportError:
+    _thread = None
+import time
+
+# Run jobs in a background thread, that on the RP2040 runs on the
+# second core. This way the CPU work needed to prepare the next image
+# (greyscale bitplanes, decoding, dithering, ...) can be done while
+# the first core transfers the current image and waits for the display
+# refresh, that takes most of the time.
+#
+# A single thread is started when the worker is created, and it executes
+# the submitted jobs one after the other until stop() is called: the
+# RP2040 port can't start a thread on the second core while the previous
+# one is still exiting, so starting a thread for each job is not an
+# option. Always call stop() when done, or the second core stays busy.
+#
+# Only one job at a time is executed. Where _thread is not available
+# (or if 'threaded' is False) the job is executed by wait() instead:
+# callers submit the job, start the display refresh, then wait, so that
+# even with a single core the job runs while the display is refreshing.
+class Worker:
+    def __init__(self,threaded=True):
+        self.threaded = threaded and _thread != None
+        self.job = None
+        self.value = None
+        self.error = None
+        if self.threaded:
+            self.pending = _thread.allocate_lock() # Released on new job.
+            self.done = _thread.allocate_lock() # Held while job running.
+            self.exited = _thread.allocate_lock() # Held by the thread.
+            self.pending.acquire()
+            self.exited.acquire()
+            self.start()
+
+    # Start the thread. If a worker was just stopped, its thread may be
+    # still exiting: retry for a while.
+    def start(self):
+        for i in range(100):
+            try:
+                _thread.start_new_thread(self.loop,())
+                return
+            except OSError:
+                time.sleep_ms(1)
+        _thread.start_new_thread(self.loop,())
+
+    # Thread main loop: wait for jobs and run them. A None job means
+    # the worker was stopped.
+    def loop(self):
+        while True:
+            self.pending.acquire()
+            if self.job == None: break
+            fn,args = self.job
+            self.job = None
+            self.run(fn,args)
+            self.done.release()
+        self.exited.release()
+
+    # Run fn(*args) in background. If a job is already running, wait
+    # for it to complete first.
+    def submit(self,fn,*args):
+        self.wait()
+        self.job = (fn,args)
+        if self.threaded:
+            self.done.acquire() # Released by loop() when done.
+            self.pending.release()
+
+    def run(self,fn,args):
+        try:
+            self.value = fn(*args)
+        except Exception as e:
+            self.error = e
+
+    # Wait for the current job to complete and return its return value.
+    # Exceptions raised by the job are raised again here.
+    def wait(self):
+        if self.threaded:
+            self.done.acquire()
+            self.done.release()
+        elif self.job != None:
+            fn,args = self.job
+            self.job = None
+            self.run(fn,args)
+        if self.error != None:
+            e = self.error
+            self.error = None
+            raise e
+        return self.value
+
+    # Wait for the current job, then terminate the thread and wait
+    # for it to exit.
+    def stop(self):
+        if self.threaded:
+            self.done.acquire()
+            self.done.release()
+            self.job = None
+            self.threaded = False
+            self.pending.release()
+            self.exited.acquire()
+
+# Update the display with a stream of images, preparing each image while
+# the display is refreshing the previous one. prepare(index,fb) is called
+# to draw the image number 'index' (starting from 0) into 'fb', a buffer
+# with the same layout of the display raw_fb: it should return False when
+# there are no more images to show. Since 'fb' may contain any previous
+# image, prepare() should draw the whole image.
+#
+# With threads, two buffers are used (the display raw_fb and a new one),
+# so that the next image can be prepared while the current one is
+# transferred. Otherwise raw_fb is reused, since the next image is only
+# prepared after the current one was transferred.
+def update_stream(eink,prepare,threaded=True):
+    worker = Worker(threaded)
+    buffers = [eink.raw_fb]
+    if worker.threaded: buffers.append(bytearray(len(eink.raw_fb)))
+    try:
+        more = prepare(0,buffers[0])
+        index = 0
+        while more:
+            fb = buffers[index%len(buffers)]
+            worker.submit(prepare,index+1,buffers[(index+1)%len(buffers)])
+            eink.wait_ready()
+            eink.update(blocking=False,fb=fb)
+            more = worker.wait()
+            index += 1
+    finally:
+        worker.stop()
+    eink.wait_and_switch_off()